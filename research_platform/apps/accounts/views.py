@@ -93,17 +93,14 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         ratings_count = Rating.objects.filter(user=user).count()
 
         try:
-            from apps.ml_engine.models import UserRecommendation
-            from apps.ml_engine.tasks import generate_recommendations
-            from apps.papers.background import executor
+            from apps.ml_engine import recommendation_cache
+            from apps.ml_engine.refresh_queue import refresh_queue
 
-            recs_qs = UserRecommendation.objects.filter(user=user).select_related('paper').order_by('-score')
+            recommendations = recommendation_cache.get_recommendations(user.id)
 
             # Auto-generate in background if user has no recommendations yet
-            if not recs_qs.exists():
-                executor.submit(generate_recommendations, user.id)
-
-            recommendations = list(recs_qs[:10])
+            if not recommendations:
+                refresh_queue.schedule(user.id, delay=0)
         except ImportError:
             recommendations = []
 
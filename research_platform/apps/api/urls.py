@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from .views import UserRegistrationAPIView, login_api_view, UserProfileAPIView
+from .views import UserRegistrationAPIView, login_api_view, UserProfileAPIView, MLStatusAPIView
 from apps.papers.views import (
     PaperListCreateView, PaperDetailView, approve_paper,
     BookmarkListCreateView, RatingListCreateView, get_recommendations
@@ -28,4 +28,5 @@ urlpatterns = [
     path('search/suggestions/', search_suggestions, name='api-search-suggestions'),
     
     path('recommendations/', get_recommendations, name='api-recommendations'),
+    path('ml/status/', MLStatusAPIView.as_view(), name='api-ml-status'),
 ]
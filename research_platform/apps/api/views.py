@@ -24,6 +24,20 @@ class UserRegistrationAPIView(APIView):
         return Response(form.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class MLStatusAPIView(APIView):
+    """Staff-only view of this worker's model registry and refresh queue counters."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        from apps.ml_engine import model_registry
+        from apps.ml_engine.refresh_queue import refresh_queue
+
+        return Response({
+            'models': model_registry.stats(),
+            'refresh_queue': refresh_queue.stats(),
+        })
+
+
 class UserProfileAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
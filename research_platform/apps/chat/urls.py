@@ -12,6 +12,7 @@ urlpatterns = [
     path('500/', views.errorView, name='500'),
     path('yggdrasil_chatbot/', views.yggdrasil_chatbot_view, name='yggdrasil_chatbot'),
     path('yggdrasil/api/', views.yggdrasil_rag_api, name='yggdrasil_api'),
+    path('yggdrasil/api/stream/', views.yggdrasil_rag_stream, name='yggdrasil_stream'),
     path('yggdrasil/conversations/', views.yggdrasil_conversations_api, name='yggdrasil_conversations'),
     path('yggdrasil/conversations/<int:conversation_id>/messages/', views.yggdrasil_conversation_messages_api, name='yggdrasil_conversation_messages'),
 ]
@@ -1,12 +1,15 @@
+import asyncio
 import json
 import logging
 
+from asgiref.sync import sync_to_async
+
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db import models
 from django.db.models import functions as db_functions
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils.decorators import method_decorator
 from django.views.generic import ListView, TemplateView
@@ -236,6 +239,58 @@ def yggdrasil_chatbot_view(request):
     return render(request, 'chat/yggdrasil_chatbot.html')
 
 
+def _start_conversation(user, query, conversation_id):
+    """Get or create the user's conversation and save their message; returns the conversation."""
+    from .models import YggdrasilConversation, YggdrasilMessage
+
+    # Get or create conversation
+    conversation = None
+    if conversation_id:
+        conversation = YggdrasilConversation.objects.filter(pk=conversation_id, user=user).first()
+    if conversation is None:
+        conversation = YggdrasilConversation.objects.create(user=user)
+
+    # Auto-title from first message
+    if conversation.title == 'New conversation' or not conversation.title:
+        conversation.title = query[:50] + ('...' if len(query) > 50 else '')
+        conversation.save(update_fields=['title'])
+
+    # Save user message
+    YggdrasilMessage.objects.create(
+        conversation=conversation,
+        role=YggdrasilMessage.ROLE_USER,
+        content=query,
+    )
+    return conversation
+
+
+def _finish_conversation(conversation, response, sources):
+    """Save the bot's answer and move the conversation to the top of the list."""
+    from .models import YggdrasilConversation, YggdrasilMessage
+
+    YggdrasilMessage.objects.create(
+        conversation=conversation,
+        role=YggdrasilMessage.ROLE_BOT,
+        content=response,
+        sources=sources,
+    )
+    # Touch updated_at so conversation bubbles to top of list
+    YggdrasilConversation.objects.filter(pk=conversation.pk).update(
+        updated_at=db_functions.Now()
+    )
+
+
+def _read_query(request):
+    """``(message, conversation_id, search_mode)`` from the JSON body; an unknown search mode is ignored."""
+    from apps.ml_engine.vector_store import SEARCH_MODES
+
+    data = json.loads(request.body)
+    search_mode = data.get('search_mode')
+    if search_mode not in SEARCH_MODES:
+        search_mode = None
+    return data.get('message', '').strip(), data.get('conversation_id'), search_mode
+
+
 @login_required
 def yggdrasil_rag_api(request):
     """POST — send a message, get a RAG response. Persists to DB."""
@@ -243,52 +298,14 @@ def yggdrasil_rag_api(request):
         return JsonResponse({'error': 'Method not allowed'}, status=405)
     try:
         from apps.ml_engine.rag_pipeline import query_rag
-        from .models import YggdrasilConversation, YggdrasilMessage
 
-        data = json.loads(request.body)
-        query = data.get('message', '').strip()
-        conversation_id = data.get('conversation_id')
+        query, conversation_id, search_mode = _read_query(request)
         if not query:
             return JsonResponse({'error': 'Empty message'}, status=400)
 
-        # Get or create conversation
-        if conversation_id:
-            try:
-                conversation = YggdrasilConversation.objects.get(
-                    pk=conversation_id, user=request.user
-                )
-            except YggdrasilConversation.DoesNotExist:
-                conversation = YggdrasilConversation.objects.create(user=request.user)
-        else:
-            conversation = YggdrasilConversation.objects.create(user=request.user)
-
-        # Auto-title from first message
-        if conversation.title == 'New conversation' or not conversation.title:
-            conversation.title = query[:50] + ('...' if len(query) > 50 else '')
-            conversation.save(update_fields=['title'])
-
-        # Save user message
-        YggdrasilMessage.objects.create(
-            conversation=conversation,
-            role=YggdrasilMessage.ROLE_USER,
-            content=query,
-        )
-
-        # Run RAG
-        result = query_rag(query)
-
-        # Save bot response
-        YggdrasilMessage.objects.create(
-            conversation=conversation,
-            role=YggdrasilMessage.ROLE_BOT,
-            content=result['response'],
-            sources=result['sources'],
-        )
-
-        # Touch updated_at so conversation bubbles to top of list
-        YggdrasilConversation.objects.filter(pk=conversation.pk).update(
-            updated_at=db_functions.Now()
-        )
+        conversation = _start_conversation(request.user, query, conversation_id)
+        result = query_rag(query, search_mode)
+        _finish_conversation(conversation, result['response'], result['sources'])
 
         return JsonResponse({
             'response': result['response'],
@@ -301,6 +318,67 @@ def yggdrasil_rag_api(request):
         return JsonResponse({'error': 'Internal server error'}, status=500)
 
 
+def _sse(event):
+    payload = dict(event)
+    name = payload.pop('event')
+    return f"event: {name}\ndata: {json.dumps(payload)}\n\n"
+
+
+async def _rag_events(user, query, conversation_id, search_mode):
+    from apps.ml_engine.rag_pipeline import astream_rag
+
+    # the user's message is saved while retrieval and generation run
+    saving = asyncio.ensure_future(sync_to_async(_start_conversation)(user, query, conversation_id))
+    try:
+        async for event in astream_rag(query, search_mode):
+            if event['event'] == 'done':
+                conversation = await saving
+                await sync_to_async(_finish_conversation)(conversation, event['response'], event['sources'])
+                event = {
+                    **event,
+                    'conversation_id': conversation.pk,
+                    'conversation_title': conversation.title,
+                }
+            yield _sse(event)
+    except Exception as exc:
+        logger.error("Yggdrasil RAG stream error: %s", exc)
+        yield _sse({'event': 'error', 'error': 'Internal server error'})
+    finally:
+        # also when the client disconnects: never leave the save running unobserved
+        try:
+            await saving
+        except Exception as exc:
+            logger.error("Yggdrasil conversation save failed: %s", exc)
+
+
+@login_required
+async def yggdrasil_rag_stream(request):
+    """
+    POST — send a message and stream the RAG answer as server-sent events. Persists to DB.
+
+    Events: ``sources`` once retrieval finishes, ``token`` for each piece of
+    the answer, then ``done`` with the full response and conversation id
+    (or ``error``). Served under ASGI, the request holds no worker thread
+    while the model is generating.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    try:
+        query, conversation_id, search_mode = _read_query(request)
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Invalid request body'}, status=400)
+    if not query:
+        return JsonResponse({'error': 'Empty message'}, status=400)
+
+    user = await request.auser()
+    response = StreamingHttpResponse(
+        _rag_events(user, query, conversation_id, search_mode), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
+
+
 @login_required
 def yggdrasil_conversations_api(request):
     """GET list of conversations. DELETE a specific one."""
@@ -0,0 +1,423 @@
+"""
+Approximate nearest-neighbour index over paper embeddings.
+
+Two backends share one interface:
+
+- ``hnsw`` : HNSW graph via hnswlib (also shipped by chromadb as chroma-hnswlib)
+- ``ivf``  : pure-NumPy inverted file index (k-means coarse quantiser)
+
+The backend is chosen with ``settings.ML_ANN_BACKEND``; when it is empty the
+recommendation engine keeps using the exact matrix product. Each embedding
+set (see ``versions``) has its own index under ``BASE_DIR / 'ann_index' /
+<model_version>`` next to ``chroma_db``, so an index prepared for a shadow
+set is never queried before that set goes live, and after a flip every
+process switches to the new set's index, or to exact search until it is
+built. The index is rebuilt with the ``build_ann_index`` command and is
+updated incrementally whenever ``build_embeddings`` encodes new papers.
+Writers hold an exclusive lock on the set's ``index.lock`` and reload the
+file before changing it, so concurrent builds do not drop each other's
+papers. Other processes pick up changes by watching the index file's
+modification time.
+"""
+import logging
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: writes are only serialised within a process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DTYPE = np.float32
+LOCK_FILENAME = 'index.lock'
+
+
+def _normalise(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=DTYPE))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def index_dir() -> Path:
+    return Path(getattr(settings, 'ML_ANN_INDEX_DIR', settings.BASE_DIR / 'ann_index'))
+
+
+class IVFIndex:
+    """Inverted file index: vectors are bucketed by their nearest k-means centroid."""
+
+    backend = 'ivf'
+    filename = 'ivf.npz'
+
+    def __init__(self, nprobe=8):
+        self.nprobe = nprobe
+        self.centroids = np.empty((0, 0), dtype=DTYPE)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, 0), dtype=DTYPE)
+        self.assign = np.empty(0, dtype=np.int32)
+        self._row_of = {}
+        self._order = None
+        self._offsets = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1] if self.vectors.ndim == 2 else 0
+
+    def build(self, ids, vectors, nlist=None, iterations=10, seed=0):
+        vectors = _normalise(vectors)
+        n = len(vectors)
+        nlist = nlist or max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n) if n else 1
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(n, nlist, replace=False)] if n else vectors[:0]
+        for _ in range(iterations if n else 0):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = vectors[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalise(centroids)
+        self.centroids = np.ascontiguousarray(centroids, dtype=DTYPE)
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vectors = np.ascontiguousarray(vectors)
+        self.assign = (
+            np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+            if n else np.empty(0, dtype=np.int32)
+        )
+        self._reindex()
+
+    def add(self, ids, vectors):
+        """Insert or replace vectors; new rows go to their nearest existing centroid."""
+        if not len(self.centroids):
+            return self.build(ids, vectors)
+        vectors = _normalise(vectors)
+        assign = np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+        new_ids, new_vectors, new_assign = [], [], []
+        for pid, vec, cluster in zip(ids, vectors, assign):
+            row = self._row_of.get(int(pid))
+            if row is None:
+                new_ids.append(pid)
+                new_vectors.append(vec)
+                new_assign.append(cluster)
+            else:
+                self.vectors[row] = vec
+                self.assign[row] = cluster
+        if new_ids:
+            self.ids = np.concatenate([self.ids, np.asarray(new_ids, dtype=np.int64)])
+            self.vectors = np.concatenate([self.vectors, np.asarray(new_vectors, dtype=DTYPE)])
+            self.assign = np.concatenate([self.assign, np.asarray(new_assign, dtype=np.int32)])
+        self._reindex()
+
+    def _reindex(self):
+        self._row_of = {int(pid): row for row, pid in enumerate(self.ids)}
+        self._order = np.argsort(self.assign, kind='stable')
+        self._offsets = np.searchsorted(
+            self.assign[self._order], np.arange(len(self.centroids) + 1)
+        )
+
+    def query(self, vector, k=10, exclude_ids=()):
+        if not len(self):
+            return []
+        query = _normalise(vector)[0]
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.concatenate(
+            [self._order[self._offsets[c]:self._offsets[c + 1]] for c in probes]
+        )
+        if exclude_ids:
+            excluded = np.fromiter(exclude_ids, dtype=np.int64, count=len(exclude_ids))
+            rows = rows[~np.isin(self.ids[rows], excluded)]
+        if not len(rows):
+            return []
+        scores = self.vectors[rows] @ query
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[rows[i]]), float(scores[i])) for i in top]
+
+    def save(self, directory):
+        path = Path(directory) / self.filename
+        tmp = path.with_suffix('.tmp.npz')
+        np.savez(
+            tmp, centroids=self.centroids, ids=self.ids, vectors=self.vectors,
+            assign=self.assign, nprobe=np.int32(self.nprobe),
+        )
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, directory):
+        with np.load(Path(directory) / cls.filename) as data:
+            index = cls(nprobe=int(data['nprobe']))
+            index.centroids = data['centroids']
+            index.ids = data['ids']
+            index.vectors = data['vectors']
+            index.assign = data['assign']
+        index._reindex()
+        return index
+
+
+class HNSWIndex:
+    """HNSW graph index backed by hnswlib, labelled directly with paper ids."""
+
+    backend = 'hnsw'
+    filename = 'hnsw.bin'
+
+    def __init__(self, dim=None, ef=64, M=16, ef_construction=200):
+        self.dim = dim
+        self.ef = ef
+        self.M = M
+        self.ef_construction = ef_construction
+        self._index = None
+
+    def __len__(self):
+        return self._index.get_current_count() if self._index is not None else 0
+
+    def _create(self, dim, capacity):
+        import hnswlib
+
+        self.dim = dim
+        self._index = hnswlib.Index(space='cosine', dim=dim)
+        self._index.init_index(
+            max_elements=max(capacity, 1), M=self.M, ef_construction=self.ef_construction
+        )
+        self._index.set_ef(self.ef)
+
+    def build(self, ids, vectors):
+        vectors = _normalise(vectors)
+        self._create(vectors.shape[1], len(vectors))
+        if len(vectors):
+            self._index.add_items(vectors, np.asarray(ids, dtype=np.int64))
+
+    def add(self, ids, vectors):
+        vectors = _normalise(vectors)
+        if self._index is None:
+            return self.build(ids, vectors)
+        needed = len(self) + len(vectors)
+        if needed > self._index.get_max_elements():
+            self._index.resize_index(max(needed, 2 * self._index.get_max_elements()))
+        # hnswlib replaces the vector when a label is already present
+        self._index.add_items(vectors, np.asarray(ids, dtype=np.int64))
+
+    def query(self, vector, k=10, exclude_ids=()):
+        if not len(self):
+            return []
+        fetch = min(k + len(exclude_ids), len(self))
+        self._index.set_ef(max(self.ef, fetch))
+        labels, distances = self._index.knn_query(_normalise(vector), k=fetch)
+        results = [
+            (int(label), 1.0 - float(dist))
+            for label, dist in zip(labels[0], distances[0])
+            if int(label) not in exclude_ids
+        ]
+        return results[:k]
+
+    def save(self, directory):
+        path = Path(directory) / self.filename
+        tmp = path.with_suffix('.tmp')
+        self._index.save_index(str(tmp))
+        np.save(Path(directory) / 'hnsw_meta.npy', np.array([self.dim, self.ef], dtype=np.int64))
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, directory):
+        import hnswlib
+
+        dim, ef = np.load(Path(directory) / 'hnsw_meta.npy')
+        index = cls(dim=int(dim), ef=int(ef))
+        index._index = hnswlib.Index(space='cosine', dim=int(dim))
+        index._index.load_index(str(Path(directory) / cls.filename))
+        index._index.set_ef(int(ef))
+        return index
+
+
+BACKENDS = {'ivf': IVFIndex, 'hnsw': HNSWIndex}
+
+
+_hnswlib_available = None
+
+
+def configured_backend():
+    """Backend name from settings, or None for exact search."""
+    global _hnswlib_available
+    backend = getattr(settings, 'ML_ANN_BACKEND', '') or None
+    if backend == 'hnsw':
+        if _hnswlib_available is None:
+            try:
+                import hnswlib  # noqa: F401
+                _hnswlib_available = True
+            except ImportError:
+                logger.warning("hnswlib is not installed; falling back to the IVF index.")
+                _hnswlib_available = False
+        if not _hnswlib_available:
+            backend = 'ivf'
+    if backend is not None and backend not in BACKENDS:
+        logger.warning("Unknown ML_ANN_BACKEND %r; using exact search.", backend)
+        return None
+    return backend
+
+
+_index = None
+_index_key = None  # (backend, model_version, file mtime) of the loaded index
+_unsaved = []  # (model_version, paper ids, vectors) added but not written yet; replayed onto a reload
+_lock = threading.RLock()
+
+
+def version_dir(model_version=None) -> Path:
+    """Directory holding the index of *model_version*, the active embedding set by default."""
+    from .versions import active_version
+
+    return index_dir() / re.sub(r'[^\w.-]', '_', model_version or active_version())
+
+
+def _index_path(backend, model_version=None):
+    return version_dir(model_version) / BACKENDS[backend].filename
+
+
+@contextmanager
+def _file_lock(model_version):
+    """Serialise writes to one set's index across threads and, where ``fcntl`` exists, across processes."""
+    directory = version_dir(model_version)
+    directory.mkdir(parents=True, exist_ok=True)
+    with _lock, open(directory / LOCK_FILENAME, 'a') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def build_index(backend=None, model_version=None, **options):
+    """
+    Build the index from all stored embeddings and persist it.
+
+    Uses the active embedding set, or *model_version* to prepare the index
+    for a set before it is activated. Each set has its own index file, so
+    processes keep querying the active set's index until the flip.
+    """
+    from .embeddings import EmbeddingMatrix, get_embedding_matrix, load_matrix
+    from .models import PaperEmbedding
+    from .versions import active_version
+
+    backend = backend or configured_backend() or 'ivf'
+    active = active_version(fresh=True)
+    model_version = model_version or active
+    if model_version == active:
+        matrix = get_embedding_matrix()
+    else:
+        matrix = EmbeddingMatrix(*load_matrix(PaperEmbedding.objects.filter(model_version=model_version)))
+    if not len(matrix):
+        logger.warning("No paper embeddings stored; not building the %s index.", backend)
+        return None
+    index = BACKENDS[backend](**options)
+    index.build(matrix.paper_ids, matrix.dense())
+    with _file_lock(model_version):
+        _save(index, backend, model_version)
+        _unsaved[:] = [update for update in _unsaved if update[0] != model_version]  # already in the matrix
+    logger.info("Built %s index of %s with %d papers", backend, model_version, len(index))
+    return index
+
+
+def get_index(model_version=None):
+    """
+    Return the on-disk index of *model_version* (the active set by default).
+
+    None if the index is disabled or has not been built for that set yet.
+    """
+    from .versions import active_version
+
+    global _index, _index_key
+    backend = configured_backend()
+    if backend is None:
+        return None
+    model_version = model_version or active_version()
+    path = _index_path(backend, model_version)
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    with _lock:
+        if _index is None or _index_key != (backend, model_version, mtime):
+            index = BACKENDS[backend].load(path.parent)
+            for version, paper_ids, vectors in _unsaved:
+                if version == model_version:
+                    index.add(paper_ids, vectors)
+            _index, _index_key = index, (backend, model_version, mtime)
+        return _index
+
+
+def _save(index, backend, model_version):
+    """Persist *index* as this process's copy; call with the file lock held."""
+    global _index, _index_key
+    index.save(version_dir(model_version))
+    _index = index
+    _index_key = (backend, model_version, _index_path(backend, model_version).stat().st_mtime)
+
+
+def update_index(paper_ids, vectors, save=True, model_version=None):
+    """
+    Add or replace papers in the persisted index of *model_version*, if one has been built.
+
+    Pass ``save=False`` when applying many batches and call ``save_index``
+    once at the end; if another process saves in between, its index is
+    reloaded and the unsaved papers are added to it again.
+    """
+    from .versions import active_version
+
+    model_version = model_version or active_version()
+    with _file_lock(model_version):
+        index = get_index(model_version)
+        if index is None:
+            return
+        index.add(paper_ids, vectors)
+        if save:
+            _save(index, index.backend, model_version)
+        else:
+            _unsaved.append((model_version, list(paper_ids), np.asarray(vectors, dtype=DTYPE)))
+
+
+def save_index(model_version=None):
+    """Write the papers added with ``save=False`` to the index of *model_version*."""
+    from .versions import active_version
+
+    model_version = model_version or active_version()
+    with _file_lock(model_version):
+        index = get_index(model_version)  # picks up other processes' saves and re-adds ours
+        if index is not None and any(update[0] == model_version for update in _unsaved):
+            _save(index, index.backend, model_version)
+        _unsaved[:] = [update for update in _unsaved if update[0] != model_version]
+
+
+def remove_indexes(keep):
+    """Delete the index directories of every embedding set other than *keep*; returns how many."""
+    keep_dir = version_dir(keep)
+    removed = 0
+    for directory in index_dir().glob('*'):
+        if directory.is_dir() and directory != keep_dir:
+            shutil.rmtree(directory, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def query(vector, k=10, exclude_ids=()):
+    """Query the active set's index; returns None when no index is available."""
+    index = get_index()
+    if index is None:
+        return None
+    if index.dim and index.dim != len(vector):
+        # a profile or query vector from another embedding set (the flip is still propagating)
+        return None
+    with _lock:
+        return index.query(vector, k, set(exclude_ids))
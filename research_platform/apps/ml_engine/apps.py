@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class MlEngineConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.ml_engine'
+
+    def ready(self):
+        if getattr(settings, 'ML_WARMUP_MODELS', False):
+            from .model_registry import warm_up
+            warm_up()
@@ -0,0 +1,182 @@
+"""
+Batch recommendation generation for every active user.
+
+Instead of running ``hybrid_recommend`` user by user, all interactions are
+loaded once, user profile vectors are built as one sparse x dense product,
+and users are scored against the whole embedding matrix in chunks. Each
+chunk's ``UserRecommendation`` rows are written in one transaction by
+``write_recommendations``.
+``run_sharded`` splits users across a process pool by ``user_id % workers``.
+"""
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.db import connection, connections
+from scipy import sparse
+
+from apps.accounts.models import User
+from apps.papers.models import Bookmark, Paper, Rating
+from . import collaborative, priors
+from .embeddings import get_embedding_matrix
+from .recommendation_engine import ImprovedRecommendationEngine, write_recommendations
+
+logger = logging.getLogger(__name__)
+
+
+class BatchRecommender:
+    def __init__(self, top_k=10, alpha=None, beta=None, gamma=None, chunk_size=256):
+        self.top_k = top_k
+        self.engine = ImprovedRecommendationEngine()
+        self.weights = self.engine.weights(alpha, beta, gamma)
+        self.chunk_size = chunk_size
+
+    def _rows(self, paper_ids):
+        """Map paper ids to embedding-matrix rows; returns (rows, valid mask)."""
+        rows = np.searchsorted(self.matrix.paper_ids, paper_ids)
+        rows = np.minimum(rows, max(len(self.matrix.paper_ids) - 1, 0))
+        valid = self.matrix.paper_ids[rows] == paper_ids if len(self.matrix) else rows < 0
+        return rows, valid
+
+    def _user_matrix(self, pairs, user_ids):
+        """Sparse users x embedding-rows indicator matrix from (user_id, paper_id) pairs."""
+        user_rows = np.searchsorted(user_ids, pairs[:, 0])
+        user_rows = np.minimum(user_rows, max(len(user_ids) - 1, 0))
+        paper_rows, valid = self._rows(pairs[:, 1])
+        valid &= user_ids[user_rows] == pairs[:, 0] if len(user_ids) else False
+        matrix = sparse.csr_matrix(
+            (np.ones(valid.sum(), dtype=np.float32), (user_rows[valid], paper_rows[valid])),
+            shape=(len(user_ids), len(self.matrix)),
+        )
+        matrix.data[:] = 1.0  # duplicates (rated and bookmarked) count once
+        return matrix
+
+    def _load(self, user_ids):
+        self.matrix = get_embedding_matrix()
+        if not np.all(np.diff(self.matrix.paper_ids) > 0):
+            raise ValueError("Embedding matrix rows must be sorted by paper id")
+        self.cf_model = collaborative.get_model()
+
+        ratings = np.array(
+            list(Rating.objects.values_list('user_id', 'paper_id', 'rating')), dtype=np.int64
+        ).reshape(-1, 3)
+        bookmarks = np.array(
+            list(Bookmark.objects.values_list('user_id', 'paper_id')), dtype=np.int64
+        ).reshape(-1, 2)
+        liked = np.concatenate([ratings[ratings[:, 2] >= 4, :2], bookmarks])
+        seen = np.concatenate([ratings[:, :2], bookmarks])
+
+        self.liked = self._user_matrix(liked, user_ids)
+        self.seen = self._user_matrix(seen, user_ids)
+
+        self.popularity = self.engine.popularity_scores(Paper.objects.values('id'))
+        self.priors = priors.current_priors()
+        self.cold_start = [] if self.priors else list(
+            Paper.objects.filter(is_approved=True).order_by('-view_count').values_list(
+                'id', 'view_count'
+            )[:self.top_k * 2]
+        )
+
+    def _content_top(self, chunk):
+        """Top 2k content candidates for each user row in *chunk* (None for cold-start users)."""
+        k = self.top_k * 2
+        liked = self.liked[chunk]
+        has_profile = np.asarray(liked.sum(axis=1)).ravel() > 0
+        results = [None] * len(chunk)
+        if not has_profile.any() or not len(self.matrix):
+            return results
+
+        profiled = np.flatnonzero(has_profile)
+        profiles = self.matrix.left_multiply(liked[profiled], exact=bool(self.matrix.rerank))
+        norms = np.linalg.norm(profiles, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        profiles /= norms
+        scores = self.matrix.dot(profiles)
+
+        seen = self.seen[chunk][profiled].tocoo()
+        scores[seen.row, seen.col] = -np.inf
+
+        top, top_scores = self.matrix.select(profiles, scores, k)
+        for i, row in enumerate(profiled):
+            valid = np.isfinite(top_scores[i])
+            results[row] = [
+                (int(self.matrix.paper_ids[c]), float(score))
+                for c, score in zip(top[i][valid], top_scores[i][valid])
+            ]
+        return results
+
+    def _score_chunk(self, chunk, user_ids):
+        alpha, beta, gamma = self.weights
+        content = self._content_top(chunk)
+        collab = self.cf_model.recommend_many(user_ids[chunk].tolist(), self.top_k * 2)
+
+        cold_users = [uid for i, uid in enumerate(user_ids[chunk].tolist()) if content[i] is None]
+        interests = priors.interests_for_users(cold_users) if cold_users and self.priors else {}
+        seen = priors.seen_by_users(cold_users) if cold_users and self.priors else {}
+
+        rows = {}
+        for i, uid in enumerate(user_ids[chunk].tolist()):
+            has_profile = content[i] is not None
+            if has_profile:
+                user_content = content[i]
+            elif self.priors:
+                user_content = self.priors.recommend(
+                    interests.get(uid, ()), self.top_k * 2, seen.get(uid, ())
+                )
+            else:
+                user_content = self.cold_start
+            popularity = {pid: self.popularity.get(pid, 0) for pid, _ in user_content}
+            ranked = self.engine.combine_scores(
+                user_content, collab.get(uid, []), popularity, has_profile,
+                self.top_k, alpha, beta, gamma,
+            )
+            rows[uid] = [(pid, float(score), reason) for pid, score, reason in ranked]
+        return rows
+
+    def run(self, shard=0, shards=1):
+        """Generate and store recommendations for this shard's active users; returns the user count."""
+        started = time.perf_counter()
+        user_ids = np.array(
+            sorted(User.objects.filter(is_active=True).values_list('id', flat=True)), dtype=np.int64
+        )
+        user_ids = user_ids[user_ids % shards == shard]
+        if not len(user_ids):
+            return 0
+        self._load(user_ids)
+
+        written = 0
+        for start in range(0, len(user_ids), self.chunk_size):
+            chunk = np.arange(start, min(start + self.chunk_size, len(user_ids)))
+            write_recommendations(self._score_chunk(chunk, user_ids))
+            written += len(chunk)
+
+        logger.info(
+            "Batch recommendations: %d users (shard %d/%d) in %.2fs",
+            written, shard, shards, time.perf_counter() - started,
+        )
+        return written
+
+
+def _run_shard(shard, shards, options):
+    return BatchRecommender(**options).run(shard=shard, shards=shards)
+
+
+def run_sharded(workers=1, **options):
+    """Run the batch over *workers* processes, one user shard each; returns the user count."""
+    if workers > 1 and connection.vendor == 'sqlite':
+        logger.warning("SQLite does not support concurrent writers; running the batch in one process.")
+        workers = 1
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return BatchRecommender(**options).run()
+
+    # Load shared read-only state once so forked workers inherit it copy-on-write
+    get_embedding_matrix()
+    collaborative.get_model()
+    priors.current_priors()
+    connections.close_all()
+
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        futures = [pool.submit(_run_shard, shard, workers, options) for shard in range(workers)]
+        return sum(future.result() for future in futures)
@@ -0,0 +1,176 @@
+"""
+Matrix-based item-item collaborative filtering.
+
+A weighted user x paper interaction matrix is built from ``Rating`` and
+``Bookmark`` once per refresh window (``settings.ML_CF_REFRESH_SECONDS``).
+Item-item cosine similarities come from sparse matrix products, computed in
+blocks of papers so memory stays bounded, and only the top-N neighbours of each
+paper are kept. Scoring a user is then a sparse row times the neighbour
+matrix.
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+BOOKMARK_WEIGHT = 0.5
+BLOCK_SIZE = 2048
+
+
+class ItemNeighbourModel:
+    def __init__(self, user_ids, paper_ids, interactions, neighbours):
+        self.user_ids = user_ids
+        self.paper_ids = paper_ids
+        self.user_index = {int(uid): row for row, uid in enumerate(user_ids)}
+        self.interactions = interactions  # CSR, users x papers
+        self.neighbours = neighbours      # CSR, papers x papers, top-N per row
+        self.built_at = time.monotonic()
+
+    def user_scores(self, user_id):
+        """Dense score vector over ``paper_ids`` for one user, or None if unknown."""
+        row = self.user_index.get(user_id)
+        if row is None:
+            return None
+        user_row = self.interactions.getrow(row)
+        scores = (user_row @ self.neighbours).toarray().ravel()
+        scores[user_row.indices] = 0.0
+        return scores
+
+    def recommend(self, user_id, top_k=10, exclude_ids=()):
+        """Return ``[(paper_id, score), ...]`` for a user's top *k* papers."""
+        scores = self.user_scores(user_id)
+        if scores is None:
+            return []
+        if exclude_ids:
+            mask = np.isin(self.paper_ids, np.fromiter(exclude_ids, dtype=np.int64))
+            scores[mask] = 0.0
+        candidates = np.flatnonzero(scores > 0)
+        if not len(candidates):
+            return []
+        k = min(top_k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.paper_ids[i]), float(scores[i])) for i in top]
+
+    def recommend_many(self, user_ids, top_k=10):
+        """Score several users with one sparse product; returns ``{user_id: [(paper_id, score), ...]}``."""
+        known = [uid for uid in user_ids if uid in self.user_index]
+        if not known:
+            return {}
+        rows = self.interactions[[self.user_index[uid] for uid in known]]
+        scores = (rows @ self.neighbours).tocsr()
+        # never recommend a paper the user already interacted with
+        scores = scores - scores.multiply(rows.astype(bool))
+        scores.eliminate_zeros()
+        results = {}
+        for i, uid in enumerate(known):
+            start, end = scores.indptr[i], scores.indptr[i + 1]
+            data, cols = scores.data[start:end], scores.indices[start:end]
+            positive = data > 0
+            data, cols = data[positive], cols[positive]
+            if len(data) > top_k:
+                keep = np.argpartition(-data, top_k - 1)[:top_k]
+                data, cols = data[keep], cols[keep]
+            order = np.argsort(-data)
+            results[uid] = [(int(self.paper_ids[c]), float(d)) for c, d in zip(cols[order], data[order])]
+        return results
+
+
+def _top_n_per_row(matrix, n):
+    """Keep the *n* largest entries in every row of a CSR matrix."""
+    matrix = matrix.tocsr()
+    indptr = [0]
+    indices, data = [], []
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        row_data = matrix.data[start:end]
+        row_idx = matrix.indices[start:end]
+        if len(row_data) > n:
+            keep = np.argpartition(-row_data, n - 1)[:n]
+            row_data, row_idx = row_data[keep], row_idx[keep]
+        indices.append(row_idx)
+        data.append(row_data)
+        indptr.append(indptr[-1] + len(row_data))
+    return sparse.csr_matrix(
+        (
+            np.concatenate(data) if data else np.empty(0, dtype=np.float32),
+            np.concatenate(indices) if indices else np.empty(0, dtype=np.int32),
+            np.asarray(indptr),
+        ),
+        shape=matrix.shape,
+    )
+
+
+def build_model(top_n=None):
+    """Build the interaction matrix and item neighbour table from the database."""
+    from apps.papers.models import Bookmark, Rating
+
+    top_n = top_n or getattr(settings, 'ML_CF_NEIGHBOURS', 50)
+    started = time.perf_counter()
+
+    ratings = np.array(
+        list(Rating.objects.values_list('user_id', 'paper_id', 'rating')), dtype=np.int64
+    ).reshape(-1, 3)
+    bookmarks = np.array(
+        list(Bookmark.objects.values_list('user_id', 'paper_id')), dtype=np.int64
+    ).reshape(-1, 2)
+
+    user_col = np.concatenate([ratings[:, 0], bookmarks[:, 0]])
+    paper_col = np.concatenate([ratings[:, 1], bookmarks[:, 1]])
+    # 1-2 stars count as nothing, 3-5 stars map to 1/3, 2/3 and 1
+    weights = np.concatenate([
+        np.maximum(ratings[:, 2] - 2, 0) / 3.0,
+        np.full(len(bookmarks), BOOKMARK_WEIGHT),
+    ]).astype(np.float32)
+
+    user_ids, user_rows = np.unique(user_col, return_inverse=True)
+    paper_ids, paper_cols = np.unique(paper_col, return_inverse=True)
+    interactions = sparse.csr_matrix(
+        (weights, (user_rows, paper_cols)), shape=(len(user_ids), len(paper_ids))
+    )
+    interactions.eliminate_zeros()
+
+    # Cosine similarity between paper columns, one block of papers at a time
+    norms = np.sqrt(np.asarray(interactions.multiply(interactions).sum(axis=0))).ravel()
+    norms[norms == 0] = 1.0
+    normalised = (interactions @ sparse.diags(1.0 / norms)).tocsr().astype(np.float32)
+    normalised_t = normalised.T.tocsr()
+    blocks = []
+    for start in range(0, len(paper_ids), BLOCK_SIZE):
+        block = (normalised_t[start:start + BLOCK_SIZE] @ normalised).tocsr()
+        # drop each paper's similarity to itself
+        entry_rows = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+        block.data[block.indices == entry_rows + start] = 0
+        block.eliminate_zeros()
+        blocks.append(_top_n_per_row(block, top_n))
+    neighbours = (
+        sparse.vstack(blocks).tocsr()
+        if blocks else sparse.csr_matrix((0, 0), dtype=np.float32)
+    )
+
+    logger.info(
+        "Built item-item CF model: %d users, %d papers, %d neighbour links in %.2fs",
+        len(user_ids), len(paper_ids), neighbours.nnz, time.perf_counter() - started,
+    )
+    return ItemNeighbourModel(user_ids, paper_ids, interactions.tocsr(), neighbours)
+
+
+_model = None
+_lock = threading.Lock()
+
+
+def get_model(max_age=None):
+    """Return the cached model, rebuilding it once it is older than the refresh window."""
+    global _model
+    max_age = max_age if max_age is not None else getattr(settings, 'ML_CF_REFRESH_SECONDS', 900)
+    if _model is not None and time.monotonic() - _model.built_at < max_age:
+        return _model
+    with _lock:
+        if _model is None or time.monotonic() - _model.built_at >= max_age:
+            _model = build_model()
+    return _model
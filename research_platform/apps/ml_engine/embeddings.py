@@ -0,0 +1,301 @@
+"""
+Compact binary storage for paper embeddings.
+
+Vectors are stored as raw little-endian float32 bytes in
+``PaperEmbedding.vector`` so a set of rows can be turned into one contiguous
+``(n_papers, dim)`` matrix with a single ``np.frombuffer`` call instead of
+decoding a JSON list per row.
+
+The module also keeps a process-level, L2-normalised copy of the active
+embedding matrix (``get_embedding_matrix``). It is rebuilt lazily when the
+version counter in the ``EmbeddingsVersion`` row, bumped by
+``bump_version`` whenever embeddings are written, no longer matches the
+cached copy. The counter lives in the database so that writes from a
+management command or another worker reach every process whatever cache
+backend is configured. Memory-bound workers can hold it
+as float16 or int8 (``settings.ML_EMBEDDING_PRECISION``). Top candidates are
+then re-ranked against the exact float32 vectors.
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DTYPE = np.dtype('<f4')
+COUNTER_PK = 1
+
+_version = None  # (counter, monotonic time it was read)
+
+
+def to_bytes(vector) -> bytes:
+    """Serialise a 1-D vector to float32 bytes."""
+    return np.ascontiguousarray(vector, dtype=DTYPE).tobytes()
+
+
+def from_bytes(blob) -> np.ndarray:
+    """Deserialise float32 bytes (or a memoryview) into a 1-D array."""
+    return np.frombuffer(blob, dtype=DTYPE)
+
+
+def load_matrix(queryset=None):
+    """
+    Load embeddings as ``(paper_ids, matrix)``, by default from the active set.
+
+    ``paper_ids`` is an int64 array and ``matrix`` a C-contiguous float32
+    array of shape ``(len(paper_ids), dim)``. Rows without a binary vector
+    (not yet migrated) are skipped.
+    """
+    if queryset is None:
+        from .versions import active_embeddings
+        queryset = active_embeddings()
+    rows = list(
+        queryset.exclude(vector__isnull=True)
+        .order_by('paper_id')
+        .values_list('paper_id', 'vector')
+    )
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=DTYPE)
+
+    paper_ids = np.fromiter((pid for pid, _ in rows), dtype=np.int64, count=len(rows))
+    buffer = b''.join(blob for _, blob in rows)
+    matrix = np.frombuffer(buffer, dtype=DTYPE).reshape(len(rows), -1)
+    return paper_ids, matrix
+
+
+def current_version() -> int:
+    """
+    The shared embeddings version counter.
+
+    It is read from the database at most every
+    ``settings.ML_EMBEDDINGS_VERSION_CHECK_SECONDS``, so other processes
+    notice a write or a set switch within that interval.
+    """
+    global _version
+    now = time.monotonic()
+    cached = _version
+    if cached is not None and now - cached[1] < getattr(settings, 'ML_EMBEDDINGS_VERSION_CHECK_SECONDS', 5):
+        return cached[0]
+    from .models import EmbeddingsVersion
+
+    counter = EmbeddingsVersion.objects.filter(pk=COUNTER_PK).values_list('counter', flat=True).first() or 0
+    _version = (counter, now)
+    return counter
+
+
+def bump_version() -> None:
+    """Mark every process's cached embedding matrix as stale."""
+    global _version
+    from django.db.models import F
+    from .models import EmbeddingsVersion
+
+    if not EmbeddingsVersion.objects.filter(pk=COUNTER_PK).update(counter=F('counter') + 1):
+        _, created = EmbeddingsVersion.objects.get_or_create(pk=COUNTER_PK, defaults={'counter': 1})
+        if not created:
+            EmbeddingsVersion.objects.filter(pk=COUNTER_PK).update(counter=F('counter') + 1)
+    _version = None  # this process re-reads it straight away
+
+
+PRECISIONS = ('float32', 'float16', 'int8')
+SCORE_BLOCK = 65536   # rows dequantised at a time when scoring a reduced-precision matrix
+EXACT_FETCH = 5000    # float32 vectors loaded per query when re-ranking
+
+
+def _normalise(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class EmbeddingMatrix:
+    """
+    Row-normalised embedding matrix with a paper id -> row index.
+
+    With *precision* ``'float16'`` or ``'int8'`` the matrix is stored in
+    reduced precision. ``'int8'`` uses symmetric per-vector scales, so row
+    ``i`` is ``matrix[i] * scale[i]``. Similarities are computed on the
+    reduced matrix one block of rows at a time. The top *rerank* candidates
+    can then be re-scored against the exact float32 vectors loaded from
+    ``PaperEmbedding``.
+    """
+
+    def __init__(self, paper_ids, matrix, version=0, precision='float32', rerank=0):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown embedding precision {precision!r}; expected one of {PRECISIONS}")
+        self.paper_ids = paper_ids
+        self.index = {int(pid): row for row, pid in enumerate(paper_ids)}
+        self.version = version
+        self.precision = precision
+        self.rerank = rerank if precision != 'float32' else 0
+        self.scale = None
+        matrix = np.asarray(matrix, dtype=DTYPE)
+        if len(matrix):
+            matrix = _normalise(matrix)
+        if precision == 'int8':
+            scale = np.abs(matrix).max(axis=1) / 127.0 if len(matrix) else np.empty(0)
+            scale[scale == 0] = 1.0
+            self.scale = scale.astype(DTYPE)
+            self.matrix = np.round(matrix / self.scale[:, np.newaxis]).astype(np.int8)
+        elif precision == 'float16':
+            self.matrix = np.ascontiguousarray(matrix, dtype=np.float16)
+        else:
+            self.matrix = np.ascontiguousarray(matrix, dtype=DTYPE)
+
+    def __len__(self):
+        return len(self.paper_ids)
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    @property
+    def quantised(self):
+        return self.precision != 'float32'
+
+    def rows(self, paper_ids):
+        """Row indices of the given papers; ids without an embedding are dropped."""
+        return np.array(
+            [self.index[pid] for pid in paper_ids if pid in self.index], dtype=np.int64
+        )
+
+    def dense(self, rows=slice(None), exact=False):
+        """
+        Float32 copy of the given rows.
+
+        With *exact* the original vectors of a reduced-precision matrix are
+        loaded from the database instead of being dequantised.
+        """
+        dense = np.array(self.matrix[rows], dtype=DTYPE)
+        if self.scale is not None:
+            dense *= self.scale[rows][:, np.newaxis]
+        if exact and self.quantised:
+            self._load_exact(np.arange(len(self))[rows], dense)
+        return dense
+
+    def _load_exact(self, rows, out):
+        from .versions import active_embeddings
+
+        paper_ids = self.paper_ids[rows]
+        for start in range(0, len(paper_ids), EXACT_FETCH):
+            chunk = paper_ids[start:start + EXACT_FETCH]
+            loaded_ids, loaded = load_matrix(active_embeddings().filter(paper_id__in=chunk.tolist()))
+            if not len(loaded_ids) or loaded.shape[1] != self.dim:
+                continue
+            order = np.argsort(chunk, kind='stable')
+            positions = np.searchsorted(chunk, loaded_ids, sorter=order)
+            out[start + order[positions]] = _normalise(loaded)
+
+    def vectors(self, paper_ids):
+        return self.dense(self.rows(paper_ids))
+
+    def dot(self, queries):
+        """Similarity of each row of *queries* (already normalised) against every row; ``(m, n)``."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=DTYPE))
+        if not self.quantised:
+            return queries @ self.matrix.T
+        scores = np.empty((len(queries), len(self)), dtype=DTYPE)
+        for start in range(0, len(self), SCORE_BLOCK):
+            block = slice(start, min(start + SCORE_BLOCK, len(self)))
+            scores[:, block] = queries @ self.dense(block).T
+        return scores
+
+    def left_multiply(self, weights, exact=False):
+        """
+        ``weights @ matrix`` for a sparse ``(m, n)`` weight matrix, without a full float32 copy.
+
+        With *exact* only the rows that carry weight are used, as exact float32 vectors.
+        """
+        if not self.quantised:
+            return np.asarray(weights @ self.matrix)
+        if exact:
+            weights = weights.tocsr()
+            used = np.unique(weights.indices)
+            return np.asarray(weights[:, used] @ self.dense(used, exact=True))
+        weights = weights.tocsc() if hasattr(weights, 'tocsc') else weights
+        result = np.zeros((weights.shape[0], self.dim), dtype=DTYPE)
+        for start in range(0, len(self), SCORE_BLOCK):
+            block = slice(start, min(start + SCORE_BLOCK, len(self)))
+            result += np.asarray(weights[:, block] @ self.dense(block))
+        return result
+
+    def scores(self, query):
+        """Cosine similarity of *query* against every row."""
+        return self.dot(_normalise(np.atleast_2d(np.asarray(query, dtype=DTYPE))))[0]
+
+    def select(self, queries, scores, k):
+        """
+        Pick the top *k* rows per query from *scores* ``(m, n)``.
+
+        On a reduced-precision matrix with re-ranking enabled, the best
+        ``max(k, rerank)`` candidates are re-scored in float32 against the
+        exact stored vectors first. Entries scored ``-inf`` (excluded) stay
+        excluded. Returns ``(rows, scores)``, both ``(m, k)`` and sorted by
+        descending score.
+        """
+        k = min(k, scores.shape[1])
+        fetch = min(max(k, self.rerank), scores.shape[1])
+        top = np.argpartition(-scores, fetch - 1, axis=1)[:, :fetch]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        if self.rerank:
+            candidates = np.unique(top)
+            exact = self.dense(candidates, exact=True)
+            queries = np.atleast_2d(np.asarray(queries, dtype=DTYPE))
+            positions = np.searchsorted(candidates, top)
+            for i, query in enumerate(queries):
+                rescored = exact[positions[i]] @ query
+                top_scores[i] = np.where(np.isfinite(top_scores[i]), rescored, -np.inf)
+        order = np.argsort(-top_scores, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def top_k(self, query, k=10, exclude_ids=()):
+        """Return ``[(paper_id, score), ...]`` for the *k* most similar papers."""
+        if not len(self):
+            return []
+        query = _normalise(np.atleast_2d(np.asarray(query, dtype=DTYPE)))
+        scores = self.dot(query)
+        excluded = self.rows(exclude_ids)
+        if len(excluded):
+            scores[0, excluded] = -np.inf
+        k = min(k, len(self) - len(excluded))
+        if k <= 0:
+            return []
+        rows, top_scores = self.select(query, scores, k)
+        return [
+            (int(self.paper_ids[row]), float(score)) for row, score in zip(rows[0], top_scores[0])
+        ]
+
+
+def configured_precision():
+    return getattr(settings, 'ML_EMBEDDING_PRECISION', 'float32') or 'float32'
+
+
+_matrix = None
+_matrix_lock = threading.Lock()
+
+
+def get_embedding_matrix() -> EmbeddingMatrix:
+    """Return the cached embedding matrix, reloading it if it is stale."""
+    global _matrix
+    version = current_version()
+    precision = configured_precision()
+    if _matrix is not None and _matrix.version == version and _matrix.precision == precision:
+        return _matrix
+    with _matrix_lock:
+        if _matrix is None or _matrix.version != version or _matrix.precision != precision:
+            paper_ids, matrix = load_matrix()
+            _matrix = EmbeddingMatrix(
+                paper_ids, matrix, version=version, precision=precision,
+                rerank=getattr(settings, 'ML_EMBEDDING_RERANK', 50),
+            )
+            logger.info(
+                "Loaded embedding matrix: %d papers, %s (%.1f MiB), version %s",
+                len(_matrix), precision, _matrix.nbytes / 2 ** 20, version,
+            )
+    return _matrix
@@ -0,0 +1,179 @@
+"""
+Text encoders for CPU-only deployments.
+
+``LocalEncoder`` encodes in the calling process with the shared registry
+model. ``ProcessEncoder`` shards each call across a pool of spawned worker
+processes, each holding its own copy of the model. Workers write their rows
+straight into a shared-memory output array, so only the input texts are
+pickled. Each worker runs ``threads`` torch threads and can optionally be
+pinned to its own slice of cores, so the workers do not oversubscribe the CPU.
+
+``get_encoder`` returns the encoder configured by ``ML_ENCODER_WORKERS``.
+With 1 worker (the default) it is the in-process encoder, which suits web
+processes. Management commands and background workers can raise the worker
+count, or build a ``ProcessEncoder`` explicitly for the length of a job.
+"""
+import atexit
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from django.conf import settings
+
+from .model_registry import default_model_name, get_sentence_model
+
+logger = logging.getLogger(__name__)
+
+DTYPE = np.float32
+
+
+class LocalEncoder:
+    """Encode in this process with the registry model."""
+
+    workers = 1
+
+    def __init__(self, model_name=None):
+        self.model_name = model_name or default_model_name()
+
+    def encode(self, texts, batch_size=32):
+        texts = list(texts)
+        model = get_sentence_model(self.model_name)
+        if not texts:
+            return np.empty((0, model.get_sentence_embedding_dimension()), dtype=DTYPE)
+        return np.asarray(
+            model.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype=DTYPE
+        )
+
+    def close(self):
+        pass
+
+
+# --- worker process side -------------------------------------------------
+
+_worker_model = None
+
+
+def _init_worker(model_name, threads, pin_cpus, slots):
+    """Load the model once per worker and limit (and optionally pin) its threads."""
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if pin_cpus and hasattr(os, 'sched_setaffinity'):
+        with slots.get_lock():
+            slot = slots.value
+            slots.value += 1
+        cpus = sorted(os.sched_getaffinity(0))
+        start = (slot * threads) % len(cpus)
+        os.sched_setaffinity(0, cpus[start:start + threads] or cpus)
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name, device='cpu')
+
+
+def _worker_dim():
+    return _worker_model.get_sentence_embedding_dimension()
+
+
+def _encode_shard(shm_name, shape, start, texts, batch_size):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray(shape, dtype=DTYPE, buffer=shm.buf)
+        out[start:start + len(texts)] = _worker_model.encode(
+            texts, batch_size=batch_size, convert_to_numpy=True
+        )
+        del out
+    finally:
+        shm.close()
+    return len(texts)
+
+
+# --- parent side -----------------------------------------------------------
+
+class ProcessEncoder:
+    """Shard ``encode`` calls across spawned worker processes."""
+
+    def __init__(self, model_name=None, workers=None, threads=None, pin_cpus=None):
+        cpus = os.cpu_count() or 1
+        self.model_name = model_name or default_model_name()
+        self.workers = workers or getattr(settings, 'ML_ENCODER_WORKERS', 1) or cpus
+        self.threads = threads or getattr(settings, 'ML_ENCODER_THREADS', 0) or max(
+            cpus // self.workers, 1
+        )
+        if pin_cpus is None:
+            pin_cpus = getattr(settings, 'ML_ENCODER_PIN_CPUS', False)
+        context = multiprocessing.get_context('spawn')
+        self._pool = ProcessPoolExecutor(
+            self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.model_name, self.threads, pin_cpus, context.Value('i', 0)),
+        )
+        self._dim = None
+        logger.info(
+            "Started encoder pool: %d workers x %d threads (%s)",
+            self.workers, self.threads, self.model_name,
+        )
+
+    @property
+    def dim(self):
+        if self._dim is None:
+            self._dim = self._pool.submit(_worker_dim).result()
+        return self._dim
+
+    def encode(self, texts, batch_size=32):
+        texts = list(texts)
+        shape = (len(texts), self.dim)
+        if not texts:
+            return np.empty(shape, dtype=DTYPE)
+
+        shard = max(batch_size, math.ceil(len(texts) / self.workers))
+        shm = shared_memory.SharedMemory(create=True, size=shape[0] * shape[1] * DTYPE().itemsize)
+        try:
+            futures = [
+                self._pool.submit(
+                    _encode_shard, shm.name, shape, start, texts[start:start + shard], batch_size
+                )
+                for start in range(0, len(texts), shard)
+            ]
+            for future in futures:
+                future.result()
+            return np.ndarray(shape, dtype=DTYPE, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_encoders = {}
+_lock = threading.Lock()
+
+
+def get_encoder(model_name=None):
+    """Return this process's encoder for *model_name*, as configured by ``ML_ENCODER_WORKERS``."""
+    model_name = model_name or default_model_name()
+    encoder = _encoders.get(model_name)
+    if encoder is not None:
+        return encoder
+    with _lock:
+        encoder = _encoders.get(model_name)
+        if encoder is None:
+            if getattr(settings, 'ML_ENCODER_WORKERS', 1) > 1:
+                encoder = ProcessEncoder(model_name)
+                atexit.register(encoder.close)
+            else:
+                encoder = LocalEncoder(model_name)
+            _encoders[model_name] = encoder
+    return encoder
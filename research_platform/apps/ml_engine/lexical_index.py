@@ -0,0 +1,357 @@
+"""
+BM25 lexical index over the vector store's chunks.
+
+Dense search misses exact terms, author names and acronyms that the
+embedding model has never seen. This index scores the same Chroma chunks
+with Okapi BM25, and ``vector_store.search_papers`` fuses both rankings with
+reciprocal rank fusion.
+
+The index is a sparse chunk x term frequency matrix saved as one ``.npz``
+file (CSR arrays with uint16 counts plus the vocabulary) in
+``settings.ML_LEXICAL_INDEX_DIR``. It is built from the Chroma collection
+by the first ``vector_store.index_papers`` or ``remove_paper`` call, by a
+background job queued from the first search, or by the
+``build_lexical_index`` command, and then kept up to date by those writes.
+Writers hold an exclusive lock on ``bm25.lock`` and reload the file before
+changing it, so concurrent processes do not overwrite each other's updates;
+each save goes to a temporary file that is renamed over the index. As with
+the ANN index, readers pick up changes by watching the file's modification
+time.
+"""
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import scipy.sparse as sp
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: writes are only serialised within a process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FILENAME = 'bm25.npz'
+LOCK_FILENAME = 'bm25.lock'
+BUILD_PAGE_SIZE = 5000
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in into is it its of on or that the their this to was were
+which with we our these those been not can also such than then there they using used use
+""".split())
+
+
+def tokenise(text: str):
+    return [
+        token for token in TOKEN_RE.findall(text.lower())
+        if token not in STOPWORDS and (len(token) > 1 or token.isdigit())
+    ]
+
+
+class BM25Index:
+    """Okapi BM25 over a CSR chunk x term count matrix; rows are addressed by Chroma chunk id."""
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.chunk_ids = []
+        self.paper_ids = np.empty(0, dtype=np.int64)
+        self.counts = sp.csr_matrix((0, 0), dtype=np.float32)
+        self.terms = []
+        self._vocab = {}
+        self._row_of = {}
+        self._pending = []  # (chunk ids, paper ids, rows) added since the last consolidation
+        self._columns = None
+        self._doc_len = None
+
+    def __len__(self):
+        self._consolidate()
+        return len(self.chunk_ids)
+
+    def add(self, chunk_ids, paper_ids, texts):
+        """Add or replace chunks."""
+        if not chunk_ids:
+            return
+        self.remove(chunk_ids)
+        indptr, indices, data = [0], [], []
+        for text in texts:
+            for term, count in Counter(tokenise(text)).items():
+                column = self._vocab.get(term)
+                if column is None:
+                    column = self._vocab[term] = len(self.terms)
+                    self.terms.append(term)
+                indices.append(column)
+                data.append(min(count, np.iinfo(np.uint16).max))
+            indptr.append(len(indices))
+        rows = (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr))
+        self._pending.append((list(chunk_ids), np.asarray(paper_ids, dtype=np.int64), rows))
+        self._columns = None
+
+    def remove(self, chunk_ids):
+        self._consolidate()
+        rows = [self._row_of[chunk_id] for chunk_id in chunk_ids if chunk_id in self._row_of]
+        if rows:
+            keep = np.ones(len(self.chunk_ids), dtype=bool)
+            keep[rows] = False
+            self._keep(keep)
+
+    def remove_papers(self, paper_ids):
+        self._consolidate()
+        keep = ~np.isin(self.paper_ids, np.asarray(list(paper_ids), dtype=np.int64))
+        if not keep.all():
+            self._keep(keep)
+
+    def _keep(self, mask):
+        self.chunk_ids = [chunk_id for chunk_id, kept in zip(self.chunk_ids, mask) if kept]
+        self.paper_ids = self.paper_ids[mask]
+        self.counts = self.counts[mask]
+        self._reindex()
+
+    def _consolidate(self):
+        if not self._pending:
+            return
+        width = len(self.terms)
+        blocks = [self.counts]
+        for chunk_ids, paper_ids, (data, indices, indptr) in self._pending:
+            blocks.append(sp.csr_matrix((data, indices, indptr), shape=(len(chunk_ids), width)))
+            self.chunk_ids.extend(chunk_ids)
+            self.paper_ids = np.concatenate([self.paper_ids, paper_ids])
+        self.counts.resize((self.counts.shape[0], width))
+        self.counts = sp.vstack(blocks, format='csr', dtype=np.float32)
+        self._pending = []
+        self._reindex()
+
+    def _reindex(self):
+        self._row_of = {chunk_id: row for row, chunk_id in enumerate(self.chunk_ids)}
+        self._columns = None
+
+    def search(self, query, k=20):
+        """Top-*k* ``(chunk_id, score)`` pairs for *query*, best first."""
+        self._consolidate()
+        columns = sorted({self._vocab[term] for term in tokenise(query) if term in self._vocab})
+        n_docs = len(self.chunk_ids)
+        if not columns or not n_docs:
+            return []
+        if self._columns is None:
+            self._columns = self.counts.tocsc()
+            self._doc_len = np.asarray(self.counts.sum(axis=1)).ravel()
+        doc_len = self._doc_len
+        norm = self.k1 * (1 - self.b + self.b * doc_len / max(doc_len.mean(), 1e-9))
+
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for column in columns:
+            start, stop = self._columns.indptr[column], self._columns.indptr[column + 1]
+            if start == stop:
+                continue
+            rows = self._columns.indices[start:stop]
+            tf = self._columns.data[start:stop]
+            df = stop - start
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            scores[rows] += idf * tf * (self.k1 + 1) / (tf + norm[rows])
+
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind='stable')]
+        return [(self.chunk_ids[row], float(scores[row])) for row in hits]
+
+    def save(self, directory):
+        self._consolidate()
+        path = Path(directory) / FILENAME
+        tmp = path.with_suffix('.tmp.npz')
+        np.savez(
+            tmp,
+            chunk_ids=np.array(self.chunk_ids, dtype=str),
+            paper_ids=self.paper_ids,
+            indptr=self.counts.indptr.astype(np.int64),
+            indices=self.counts.indices.astype(np.int32),
+            counts=self.counts.data.astype(np.uint16),
+            terms=np.array(self.terms, dtype=str),
+            params=np.array([self.k1, self.b]),
+        )
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, directory):
+        with np.load(Path(directory) / FILENAME) as data:
+            k1, b = data['params']
+            index = cls(k1=float(k1), b=float(b))
+            index.chunk_ids = data['chunk_ids'].tolist()
+            index.paper_ids = data['paper_ids']
+            index.terms = data['terms'].tolist()
+            index.counts = sp.csr_matrix(
+                (data['counts'].astype(np.float32), data['indices'], data['indptr']),
+                shape=(len(index.chunk_ids), len(index.terms)),
+            )
+        index._vocab = {term: column for column, term in enumerate(index.terms)}
+        index._reindex()
+        return index
+
+
+_index = None
+_index_mtime = None
+_unsaved = []  # updates applied in memory but not written yet; replayed onto a reload
+_lock = threading.RLock()
+_building = threading.Event()
+
+
+def index_dir() -> Path:
+    return Path(getattr(settings, 'ML_LEXICAL_INDEX_DIR', settings.BASE_DIR / 'lexical_index'))
+
+
+def _index_path():
+    return index_dir() / FILENAME
+
+
+@contextmanager
+def _file_lock():
+    """Serialise index writes across threads and, where ``fcntl`` exists, across processes."""
+    directory = index_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    with _lock, open(directory / LOCK_FILENAME, 'a') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _apply(index, chunk_ids, paper_ids, texts, removed_ids, removed_papers):
+    if removed_papers:
+        index.remove_papers(removed_papers)
+    if removed_ids:
+        index.remove(removed_ids)
+    index.add(chunk_ids, paper_ids, texts)
+
+
+def _save(index):
+    """Persist *index* as this process's copy; call with the file lock held."""
+    global _index, _index_mtime
+    index.save(index_dir())
+    _index, _index_mtime = index, _index_path().stat().st_mtime
+    _unsaved.clear()
+
+
+def _build(collection=None):
+    """Index every chunk in the Chroma collection and persist it; call with the file lock held."""
+    from .vector_store import bump_index_generation, get_collection
+
+    collection = collection or get_collection()
+    if collection is None:
+        return None
+    index = BM25Index()
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=BUILD_PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        index.add(
+            page["ids"],
+            [metadata.get("paper_id", 0) for metadata in page["metadatas"]],
+            page["documents"],
+        )
+        offset += len(page["ids"])
+    _save(index)
+    bump_index_generation()  # cached search results were ranked without it
+    logger.info("Built lexical index with %d chunks and %d terms", len(index), len(index.terms))
+    return index
+
+
+def build_index(collection=None):
+    """Rebuild the index from every chunk in the Chroma collection and persist it."""
+    with _file_lock():
+        return _build(collection)
+
+
+def ensure_index(collection=None):
+    """Return the index, building it from the Chroma collection first if it has never been built."""
+    index = get_index()
+    if index is not None:
+        return index
+    with _file_lock():
+        index = get_index()  # another process may have built it while we waited
+        return index if index is not None else _build(collection)
+
+
+def _build_in_background():
+    try:
+        ensure_index()
+    except Exception as exc:
+        logger.error("Lexical index build failed: %s", exc)
+    finally:
+        _building.clear()
+
+
+def schedule_build():
+    """Queue a background ``ensure_index`` unless one is already running."""
+    from apps.papers.background import executor
+
+    if not _building.is_set():
+        _building.set()
+        executor.submit(_build_in_background)
+
+
+def get_index():
+    """Return the on-disk index, loading it on first use; None if it has not been built."""
+    global _index, _index_mtime
+    try:
+        mtime = _index_path().stat().st_mtime
+    except FileNotFoundError:
+        return None
+    with _lock:
+        if _index is None or _index_mtime != mtime:
+            index = BM25Index.load(index_dir())
+            for update in _unsaved:
+                _apply(index, *update)
+            _index, _index_mtime = index, mtime
+        return _index
+
+
+def update_index(chunk_ids=(), paper_ids=(), texts=(), removed_ids=(), removed_papers=(), save=True):
+    """
+    Apply a vector store write to the persisted index.
+
+    Call after the write has reached the Chroma collection: the first call
+    in a fresh deployment builds the whole index from the collection. Pass
+    ``save=False`` when applying many batches and call ``save_index`` once
+    at the end; if another process saves in between, its index is reloaded
+    and the unsaved batches are applied to it again.
+    """
+    update = (list(chunk_ids), list(paper_ids), list(texts), list(removed_ids), list(removed_papers))
+    with _file_lock():
+        index = get_index()
+        if index is None:
+            _build()  # the collection already holds this write
+            return
+        _apply(index, *update)
+        if save:
+            _save(index)
+        else:
+            _unsaved.append(update)
+
+
+def save_index():
+    """Write the updates applied with ``save=False`` to disk."""
+    with _file_lock():
+        index = get_index()  # picks up other processes' saves and re-applies ours
+        if index is not None and _unsaved:
+            _save(index)
+
+
+def search(query, k=20):
+    """BM25 ``(chunk_id, score)`` pairs, or None (queueing a build) when no index has been built."""
+    index = get_index()
+    if index is None:
+        schedule_build()
+        return None
+    with _lock:
+        return index.search(query, k)
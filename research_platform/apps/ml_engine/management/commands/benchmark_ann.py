@@ -0,0 +1,74 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from apps.ml_engine import ann_index
+from apps.ml_engine.embeddings import get_embedding_matrix
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare recall@k and query latency of the approximate nearest-neighbour '
+        'index against exact matrix search over the stored paper embeddings.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=sorted(ann_index.BACKENDS), default='ivf')
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16],
+                            help='IVF: nprobe values to sweep.')
+        parser.add_argument('--ef', type=int, nargs='+', default=[16, 64, 128],
+                            help='HNSW: ef values to sweep.')
+        parser.add_argument('--noise', type=float, default=0.1,
+                            help='Gaussian noise added to sampled paper vectors to form queries.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        matrix = get_embedding_matrix()
+        if not len(matrix):
+            self.stdout.write(self.style.WARNING('No embeddings found — run build_embeddings first.'))
+            return
+
+        rng = np.random.default_rng(options['seed'])
+        k = options['k']
+        rows = rng.choice(len(matrix), min(options['queries'], len(matrix)), replace=False)
+        queries = matrix.dense(rows) + options['noise'] * rng.standard_normal(
+            (len(rows), matrix.dim)
+        ).astype(np.float32)
+
+        exact, exact_ms = [], []
+        for q in queries:
+            started = time.perf_counter()
+            exact.append({pid for pid, _ in matrix.top_k(q, k)})
+            exact_ms.append((time.perf_counter() - started) * 1000)
+        self._report('exact', exact_ms, 1.0)
+
+        backend = options['backend']
+        index = ann_index.BACKENDS[backend]()
+        started = time.perf_counter()
+        index.build(matrix.paper_ids, matrix.dense())
+        self.stdout.write(f'Built {backend} index over {len(index)} papers '
+                          f'in {time.perf_counter() - started:.2f}s')
+
+        sweep = options['nprobe'] if backend == 'ivf' else options['ef']
+        for value in sweep:
+            if backend == 'ivf':
+                index.nprobe = value
+            else:
+                index.ef = value
+            latencies, recalls = [], []
+            for q, truth in zip(queries, exact):
+                started = time.perf_counter()
+                found = {pid for pid, _ in index.query(q, k)}
+                latencies.append((time.perf_counter() - started) * 1000)
+                recalls.append(len(found & truth) / len(truth) if truth else 1.0)
+            label = f'{backend} {"nprobe" if backend == "ivf" else "ef"}={value}'
+            self._report(label, latencies, float(np.mean(recalls)))
+
+    def _report(self, label, latencies_ms, recall):
+        p50, p95 = np.percentile(latencies_ms, [50, 95])
+        self.stdout.write(
+            f'{label:<20} recall@k={recall:.3f}  p50={p50:.3f}ms  p95={p95:.3f}ms'
+        )
@@ -0,0 +1,55 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from apps.ml_engine.embeddings import PRECISIONS, EmbeddingMatrix, load_matrix
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare memory, query latency and ranking agreement of float16 and int8 '
+        'embedding matrices (with and without float32 re-ranking) against float32.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--rerank', type=int, default=50,
+                            help='Candidates re-ranked in float32 for the re-rank runs.')
+        parser.add_argument('--noise', type=float, default=0.1,
+                            help='Gaussian noise added to sampled paper vectors to form queries.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        paper_ids, raw = load_matrix()
+        if not len(paper_ids):
+            self.stdout.write(self.style.WARNING('No embeddings found — run build_embeddings first.'))
+            return
+
+        k = options['k']
+        rng = np.random.default_rng(options['seed'])
+        reference = EmbeddingMatrix(paper_ids, raw)
+        rows = rng.choice(len(reference), min(options['queries'], len(reference)), replace=False)
+        queries = reference.dense(rows) + options['noise'] * rng.standard_normal(
+            (len(rows), reference.dim)
+        ).astype(np.float32)
+        truth = [reference.top_k(q, k) for q in queries]
+
+        for precision in PRECISIONS:
+            for rerank in ([0] if precision == 'float32' else [0, options['rerank']]):
+                matrix = EmbeddingMatrix(paper_ids, raw, precision=precision, rerank=rerank)
+                latencies, recalls, errors = [], [], []
+                for q, expected in zip(queries, truth):
+                    started = time.perf_counter()
+                    found = matrix.top_k(q, k)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    expected_ids = {pid for pid, _ in expected}
+                    recalls.append(len({pid for pid, _ in found} & expected_ids) / len(expected_ids))
+                    errors.append(np.mean([abs(a - b) for (_, a), (_, b) in zip(found, expected)]))
+                label = precision + (f' +rerank {rerank}' if rerank else '')
+                p50, p95 = np.percentile(latencies, [50, 95])
+                self.stdout.write(
+                    f'{label:<20} {matrix.nbytes / 2 ** 20:8.2f} MiB  recall@k={np.mean(recalls):.3f}  '
+                    f'score err={np.mean(errors):.5f}  p50={p50:.3f}ms  p95={p95:.3f}ms'
+                )
@@ -0,0 +1,211 @@
+import datetime
+import json
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from apps.accounts.models import User
+from apps.ml_engine import collaborative, versions
+from apps.ml_engine.batch import BatchRecommender
+from apps.ml_engine.embeddings import bump_version
+from apps.ml_engine.models import PaperEmbedding
+from apps.ml_engine.recommendation_engine import ImprovedRecommendationEngine
+from apps.papers.models import Bookmark, Paper, Rating
+
+STAGES = ('profile', 'content', 'collaborative', 'hybrid', 'save')
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark ImprovedRecommendationEngine on a synthetic corpus: per-stage p50/p95 '
+        'latency, queries per call and precision/recall@k on held-out ratings. The corpus '
+        'is created inside a transaction that is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--papers', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--interactions', type=int, default=30,
+                            help='Ratings per synthetic user (bookmarks add a third on top).')
+        parser.add_argument('--topics', type=int, default=20, help='Topic clusters in the synthetic corpus.')
+        parser.add_argument('--dim', type=int, default=384)
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--holdout', type=float, default=0.2,
+                            help='Share of each user\'s 4-5 star ratings held out for evaluation.')
+        parser.add_argument('--sample-users', type=int, default=50, help='Users timed stage by stage.')
+        parser.add_argument('--batch', action='store_true', help='Also time one batch run over all users.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # the on-disk ANN index knows nothing about the synthetic papers
+        with override_settings(ML_ANN_BACKEND=''):
+            try:
+                with transaction.atomic():
+                    results = self._run(options)
+                    raise _Rollback
+            except _Rollback:
+                pass
+            finally:
+                bump_version()
+
+        for stage, figures in results['stages'].items():
+            self.stdout.write(
+                f"{stage:<14} p50={figures['p50_ms']:8.2f}ms  p95={figures['p95_ms']:8.2f}ms  "
+                f"queries={figures['queries_mean']:.1f}"
+            )
+        metrics = results['metrics']
+        self.stdout.write(
+            f"precision@{options['k']}={metrics['precision_at_k']:.4f}  "
+            f"recall@{options['k']}={metrics['recall_at_k']:.4f}  "
+            f"({metrics['users_evaluated']} users)"
+        )
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def _run(self, options):
+        rng = np.random.default_rng(options['seed'])
+        started = time.perf_counter()
+        users, held_out = self._build_corpus(rng, options)
+        setup_seconds = time.perf_counter() - started
+        bump_version()
+        collaborative.get_model(max_age=0)
+
+        engine = ImprovedRecommendationEngine()
+        k = options['k']
+        timings, queries = defaultdict(list), defaultdict(list)
+
+        def measure(stage, fn, *args, **kwargs):
+            with CaptureQueriesContext(connection) as ctx:
+                began = time.perf_counter()
+                value = fn(*args, **kwargs)
+                timings[stage].append((time.perf_counter() - began) * 1000)
+            queries[stage].append(len(ctx))
+            return value
+
+        sample = rng.choice(len(users), min(options['sample_users'], len(users)), replace=False)
+        for row in sample:
+            user = users[row]
+            user_vec = measure('profile', engine.get_user_profile_vector, user)
+            measure('content', engine.content_scores, user, k * 2, user_vec)
+            measure('collaborative', engine.collaborative_scores, user, k * 2)
+            ranked = measure('hybrid', engine.hybrid_recommend, user, k)
+            measure('save', engine.save_recommendations, user, ranked)
+
+        precision, recall = [], []
+        for user in users:
+            expected = held_out.get(user.id)
+            if not expected:
+                continue
+            found = {paper.id for paper, _, _ in engine.hybrid_recommend(user, k)}
+            hits = len(found & expected)
+            precision.append(hits / k)
+            recall.append(hits / len(expected))
+
+        stages = {
+            stage: {
+                'p50_ms': round(float(np.percentile(timings[stage], 50)), 3),
+                'p95_ms': round(float(np.percentile(timings[stage], 95)), 3),
+                'mean_ms': round(float(np.mean(timings[stage])), 3),
+                'queries_mean': round(float(np.mean(queries[stage])), 2),
+                'calls': len(timings[stage]),
+            }
+            for stage in STAGES
+        }
+        if options['batch']:
+            began = time.perf_counter()
+            with CaptureQueriesContext(connection) as ctx:
+                count = BatchRecommender(top_k=k).run()
+            seconds = time.perf_counter() - began
+            stages['batch'] = {
+                'p50_ms': round(seconds * 1000, 3), 'p95_ms': round(seconds * 1000, 3),
+                'mean_ms': round(seconds * 1000 / max(count, 1), 3),
+                'queries_mean': float(len(ctx)), 'calls': 1, 'users': count,
+            }
+
+        return {
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'config': {
+                name: options[name] for name in (
+                    'papers', 'users', 'interactions', 'topics', 'dim', 'k',
+                    'holdout', 'sample_users', 'seed',
+                )
+            },
+            'setup_seconds': round(setup_seconds, 3),
+            'stages': stages,
+            'metrics': {
+                'precision_at_k': round(float(np.mean(precision)) if precision else 0.0, 4),
+                'recall_at_k': round(float(np.mean(recall)) if recall else 0.0, 4),
+                'users_evaluated': len(precision),
+            },
+        }
+
+    def _build_corpus(self, rng, options):
+        """Create clustered papers, embeddings and users; returns (users, {user_id: held-out paper ids})."""
+        n_papers, n_users, topics = options['papers'], options['users'], options['topics']
+        tag = f'bench{rng.integers(1 << 30)}'
+
+        uploader = User.objects.create(username=f'{tag}-uploader', email=f'{tag}-uploader@example.com')
+        papers = Paper.objects.bulk_create([
+            Paper(
+                title=f'Synthetic paper {i}', abstract=f'Synthetic abstract {i}', authors='Benchmark',
+                publication_date=datetime.date(2020, 1, 1), uploaded_by=uploader, is_approved=True,
+                view_count=int(rng.integers(1000)), download_count=int(rng.integers(200)),
+            )
+            for i in range(n_papers)
+        ])
+        paper_ids = np.array([paper.id for paper in papers], dtype=np.int64)
+        paper_topic = rng.integers(topics, size=n_papers)
+
+        centroids = rng.standard_normal((topics, options['dim'])).astype(np.float32)
+        vectors = centroids[paper_topic] + 0.5 * rng.standard_normal(
+            (n_papers, options['dim'])
+        ).astype(np.float32)
+        version = versions.active_version()
+        PaperEmbedding.objects.bulk_create([
+            PaperEmbedding(paper_id=int(pid), embedding=vec, model_version=version)
+            for pid, vec in zip(paper_ids, vectors)
+        ], batch_size=1000)
+
+        users = User.objects.bulk_create([
+            User(username=f'{tag}-user{i}', email=f'{tag}-user{i}@example.com')
+            for i in range(n_users)
+        ])
+        by_topic = [np.flatnonzero(paper_topic == t) for t in range(topics)]
+        ratings, bookmarks, held_out = [], [], {}
+        n_ratings = min(options['interactions'], n_papers)
+        for user in users:
+            liked_topics = rng.choice(topics, 2, replace=False)
+            preferred = np.concatenate([by_topic[t] for t in liked_topics])
+            n_pref = min(int(n_ratings * 0.7), len(preferred))
+            rows = rng.choice(preferred, n_pref, replace=False)
+            others = np.setdiff1d(np.arange(n_papers), rows)
+            rows = np.concatenate([rows, rng.choice(others, n_ratings - n_pref, replace=False)])
+            scores = np.where(
+                np.isin(paper_topic[rows], liked_topics),
+                rng.integers(4, 6, size=len(rows)), rng.integers(1, 4, size=len(rows)),
+            )
+            liked = rows[scores >= 4]
+            hold = rng.choice(liked, int(len(liked) * options['holdout']), replace=False)
+            held_out[user.id] = set(paper_ids[hold].tolist())
+            keep = ~np.isin(rows, hold)
+            ratings.extend(
+                Rating(user=user, paper_id=int(paper_ids[row]), rating=int(score))
+                for row, score in zip(rows[keep], scores[keep])
+            )
+            kept_liked = rows[keep & (scores >= 4)]
+            for row in rng.choice(kept_liked, min(n_ratings // 3, len(kept_liked)), replace=False):
+                bookmarks.append(Bookmark(user=user, paper_id=int(paper_ids[row])))
+        Rating.objects.bulk_create(ratings, batch_size=1000)
+        Bookmark.objects.bulk_create(bookmarks, batch_size=1000, ignore_conflicts=True)
+        return users, held_out
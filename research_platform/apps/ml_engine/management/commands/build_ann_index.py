@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from apps.ml_engine import ann_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the approximate nearest-neighbour index over all paper embeddings '
+        'and save it next to chroma_db. Run after build_embeddings.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend',
+            choices=sorted(ann_index.BACKENDS),
+            help='Index backend (defaults to ML_ANN_BACKEND, or ivf).',
+        )
+        parser.add_argument('--nlist', type=int, help='IVF: number of k-means clusters.')
+        parser.add_argument('--nprobe', type=int, default=8, help='IVF: clusters probed per query.')
+
+    def handle(self, *args, **options):
+        backend = options['backend'] or ann_index.configured_backend() or 'ivf'
+        kwargs = {'nprobe': options['nprobe']} if backend == 'ivf' else {}
+        self.stdout.write(f'Building {backend} index...')
+        index = ann_index.build_index(backend, **kwargs)
+        if index is None:
+            self.stdout.write(self.style.WARNING('No embeddings found — run build_embeddings first.'))
+            return
+        if backend == 'ivf' and options['nlist']:
+            index.build(index.ids, index.vectors, nlist=options['nlist'])
+            index.save(ann_index.version_dir())
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {len(index)} papers in {ann_index.version_dir()}.'
+        ))
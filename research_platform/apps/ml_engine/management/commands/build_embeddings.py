@@ -1,6 +1,9 @@
+import time
+
 from django.core.management.base import BaseCommand
+from apps.ml_engine.batch import run_sharded
+from apps.ml_engine.encoders import ProcessEncoder
 from apps.ml_engine.recommendation_engine import ImprovedRecommendationEngine
-from apps.accounts.models import User
 
 
 class Command(BaseCommand):
@@ -16,24 +19,78 @@ class Command(BaseCommand):
             action='store_true',
             help='Also generate recommendations for every active user after building embeddings.',
         )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Re-encode every approved paper, even if its text and model version are unchanged.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Papers read, encoded and written per batch (defaults to ML_ENCODE_BATCH_SIZE).',
+        )
+        parser.add_argument(
+            '--encoder-workers',
+            type=int,
+            help='Encode papers in this many worker processes (defaults to ML_ENCODER_WORKERS).',
+        )
+        parser.add_argument(
+            '--encoder-threads',
+            type=int,
+            help='Torch threads per encoder worker (defaults to cores / workers).',
+        )
+        parser.add_argument(
+            '--pin-cpus',
+            action='store_true',
+            help='Pin each encoder worker to its own set of cores.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of processes used for --for-all-users (users are sharded by id).',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=256,
+            help='Users scored per matrix multiply with --for-all-users.',
+        )
 
     def handle(self, *args, **options):
         engine = ImprovedRecommendationEngine()
 
         self.stdout.write('Building paper embeddings...')
-        engine.build_embeddings()
-        self.stdout.write(self.style.SUCCESS('Embeddings built successfully.'))
+        started = time.perf_counter()
+        encoder = None
+        if (options['encoder_workers'] or 1) > 1:
+            encoder = ProcessEncoder(
+                workers=options['encoder_workers'],
+                threads=options['encoder_threads'],
+                pin_cpus=options['pin_cpus'] or None,
+            )
+            self.stdout.write(f'Encoding with {encoder.workers} worker processes x {encoder.threads} threads.')
+        try:
+            encoded = engine.build_embeddings(
+                full=options['full'], batch_size=options['batch_size'],
+                progress=self._progress, encoder=encoder,
+            )
+        finally:
+            if encoder is not None:
+                encoder.close()
+        self.stdout.write(self.style.SUCCESS(
+            f'Embeddings built successfully ({encoded} papers encoded '
+            f'in {time.perf_counter() - started:.1f}s).'
+        ))
 
         if options['for_all_users']:
-            users = User.objects.filter(is_active=True)
-            self.stdout.write(f'Generating recommendations for {users.count()} users...')
-            ok = 0
-            for user in users:
-                try:
-                    ranked = engine.hybrid_recommend(user)
-                    engine.save_recommendations(user, ranked)
-                    self.stdout.write(f'  ✓ {user.username}: {len(ranked)} recommendations')
-                    ok += 1
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f'  ✗ {user.username}: {e}'))
-            self.stdout.write(self.style.SUCCESS(f'Done — {ok}/{users.count()} users updated.'))
+            self.stdout.write(f"Generating recommendations for all active users ({options['workers']} worker(s))...")
+            started = time.perf_counter()
+            count = run_sharded(workers=options['workers'], chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Done — {count} users updated in {time.perf_counter() - started:.1f}s.'
+            ))
+
+    def _progress(self, seen, encoded, elapsed):
+        rate = seen / elapsed if elapsed else 0.0
+        self.stdout.write(f'  {seen} papers read, {encoded} encoded ({rate:.1f} papers/s)')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from apps.ml_engine import lexical_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the BM25 lexical index over every chunk in the ChromaDB vector store '
+        'and save it next to chroma_db. build_vector_index creates it when missing.'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Building lexical index...')
+        index = lexical_index.build_index()
+        if index is None or not len(index):
+            self.stdout.write(self.style.WARNING('No indexed chunks found — run build_vector_index first.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {len(index)} chunks ({len(index.terms)} terms) in {lexical_index.index_dir()}.'
+        ))
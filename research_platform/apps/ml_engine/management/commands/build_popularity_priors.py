@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from apps.ml_engine import priors
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the global and per-category popularity priors used for cold-start '
+        'recommendations. Schedule it periodically (e.g. hourly via cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-n', type=int, help='Papers kept per list (defaults to ML_PRIORS_TOP_N).')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Building popularity priors...')
+        count = priors.build_priors(top_n=options['top_n'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {count} prior lists (1 global, {count - 1} categories).'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from apps.ml_engine import related
+
+
+class Command(BaseCommand):
+    help = (
+        'Precompute the most similar papers for every embedded paper and store them '
+        'as RelatedPaper rows. Run after build_embeddings.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, help='Neighbours per paper (defaults to ML_RELATED_PAPERS).')
+        parser.add_argument(
+            '--block-size', type=int, default=related.BLOCK_SIZE,
+            help='Papers scored per matrix block; bounds peak memory.',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Computing related papers...')
+        count = related.build_related(k=options['k'], block_size=options['block_size'])
+        if not count:
+            self.stdout.write(self.style.WARNING('No embeddings found — run build_embeddings first.'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Stored related papers for {count} papers.'))
@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand
+from apps.ml_engine import lexical_index, vector_store
+from apps.ml_engine.encoders import ProcessEncoder
+from apps.papers.models import Paper
+
+
+class Command(BaseCommand):
+    help = (
+        'Index approved papers into the ChromaDB vector store used by the RAG chat. '
+        'Run after bulk paper imports; unchanged papers are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paper_ids', nargs='*', type=int, help='Only index these papers (default: all approved).')
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Re-index every paper, even if its text, chunker and model are unchanged.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Papers extracted, embedded and written per batch (defaults to ML_VECTOR_INDEX_BATCH_SIZE).',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='PDF text extraction processes (defaults to ML_VECTOR_INDEX_WORKERS).',
+        )
+        parser.add_argument(
+            '--encoder-workers',
+            type=int,
+            help='Embed chunks in this many worker processes (defaults to ML_ENCODER_WORKERS).',
+        )
+
+    def handle(self, *args, **options):
+        paper_ids = options['paper_ids'] or list(
+            Paper.objects.filter(is_approved=True).values_list('id', flat=True)
+        )
+        if not paper_ids:
+            self.stdout.write(self.style.WARNING('No approved papers to index.'))
+            return
+
+        self.stdout.write(f'Indexing {len(paper_ids)} papers...')
+        self._started = time.perf_counter()
+        encoder = None
+        if (options['encoder_workers'] or 1) > 1:
+            encoder = ProcessEncoder(workers=options['encoder_workers'])
+        try:
+            indexed = vector_store.index_papers(
+                paper_ids, batch_size=options['batch_size'], workers=options['workers'],
+                progress=self._progress, encoder=encoder, full=options['full'],
+            )
+        finally:
+            if encoder is not None:
+                encoder.close()
+        lexical_index.ensure_index()  # builds it if no batch above wrote to it
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {indexed} new or changed papers in {time.perf_counter() - self._started:.1f}s.'
+        ))
+
+    def _progress(self, seen, indexed):
+        elapsed = time.perf_counter() - self._started
+        rate = seen / elapsed if elapsed else 0.0
+        self.stdout.write(f'  {seen} papers read, {indexed} indexed ({rate:.1f} papers/s)')
@@ -0,0 +1,92 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.ml_engine import ann_index, related, versions
+from apps.ml_engine.encoders import ProcessEncoder
+from apps.ml_engine.models import RecommendationModel
+
+
+class Command(BaseCommand):
+    help = (
+        'Switch paper embeddings to a new sentence model without downtime: back-fill a '
+        'shadow embedding set while the current one serves traffic, flip the active '
+        'RecommendationModel, rebuild derived indexes and remove the old set.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('version', nargs='?', help='Embedding set label, e.g. "mpnet-v1".')
+        parser.add_argument('--model', help='sentence-transformers model name or path for a new set.')
+        parser.add_argument('--status', action='store_true', help='List embedding sets and their coverage.')
+        parser.add_argument('--no-activate', action='store_true', help='Only back-fill the shadow set.')
+        parser.add_argument('--force', action='store_true', help='Activate even if coverage is incomplete.')
+        parser.add_argument('--keep-old', action='store_true', help='Do not delete the previous set.')
+        parser.add_argument('--batch-size', type=int, help='Papers encoded and written per batch.')
+        parser.add_argument('--encoder-workers', type=int, help='Encode in this many worker processes.')
+
+    def handle(self, *args, **options):
+        if options['status'] or not options['version']:
+            return self._status()
+
+        version = options['version']
+        if options['model']:
+            versions.register_version(version, options['model'])
+        elif not RecommendationModel.objects.filter(version=version).exists():
+            raise CommandError(f'Embedding set {version!r} is not registered; pass --model.')
+
+        encoder = None
+        if (options['encoder_workers'] or 1) > 1:
+            encoder = ProcessEncoder(versions.model_name_for(version), workers=options['encoder_workers'])
+        started = time.perf_counter()
+        try:
+            self.stdout.write(f'Back-filling {version} with {versions.model_name_for(version)}...')
+            encoded = versions.backfill(
+                version, batch_size=options['batch_size'], encoder=encoder, progress=self._progress,
+            )
+        finally:
+            if encoder is not None:
+                encoder.close()
+        embedded, approved = versions.coverage(version)
+        self.stdout.write(self.style.SUCCESS(
+            f'Encoded {encoded} papers in {time.perf_counter() - started:.1f}s; '
+            f'{version} covers {embedded}/{approved} approved papers.'
+        ))
+        if options['no_activate']:
+            return
+
+        if ann_index.configured_backend():
+            # in the new set's own directory, so live processes keep using the old set's index until the flip
+            ann_index.build_index(model_version=version)
+            self.stdout.write(f'Built the ANN index of {version}.')
+
+        previous = versions.active_version(fresh=True)
+        try:
+            versions.activate(version, require_complete=not options['force'], batch_size=options['batch_size'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f'Active embedding set: {previous} -> {version}.'))
+        self.stdout.write(f'Rebuilt related papers for {related.build_related()} papers.')
+
+        if not options['keep_old']:
+            # let every process notice the flip before the set it may still be reading goes away
+            wait = getattr(settings, 'ML_EMBEDDINGS_VERSION_CHECK_SECONDS', 5)
+            self.stdout.write(f'Waiting {wait:g}s for other processes to switch...')
+            time.sleep(wait)
+            # papers a lagging process wrote into the old set during that window
+            versions.backfill(version, paper_ids=versions.missing_papers(version), batch_size=options['batch_size'])
+            self.stdout.write(f'Removed {versions.cleanup()} embeddings of inactive sets.')
+
+    def _status(self):
+        active = versions.active_version()
+        rows = RecommendationModel.objects.order_by('created_at')
+        if not rows.exists():
+            self.stdout.write(f'{active} (default, active)')
+        for row in rows:
+            embedded, approved = versions.coverage(row.version)
+            marker = ' (active)' if row.version == active else ''
+            self.stdout.write(f'{row.version:<20} {row.model_path:<40} {embedded}/{approved}{marker}')
+
+    def _progress(self, seen, encoded, elapsed):
+        rate = seen / elapsed if elapsed else 0.0
+        self.stdout.write(f'  {seen} papers read, {encoded} encoded ({rate:.1f} papers/s)')
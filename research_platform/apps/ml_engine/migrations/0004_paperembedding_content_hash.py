@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_engine', '0003_alter_userrecommendation_reason'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paperembedding',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
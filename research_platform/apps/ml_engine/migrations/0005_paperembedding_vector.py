@@ -0,0 +1,53 @@
+import numpy as np
+from django.db import migrations, models
+
+
+def json_to_binary(apps, schema_editor):
+    PaperEmbedding = apps.get_model('ml_engine', 'PaperEmbedding')
+    batch = []
+    for pe in PaperEmbedding.objects.only('id', 'embedding').iterator(chunk_size=1000):
+        if not pe.embedding:
+            continue
+        vector = np.asarray(pe.embedding, dtype='<f4')
+        pe.vector = vector.tobytes()
+        pe.dim = vector.shape[0]
+        batch.append(pe)
+        if len(batch) >= 1000:
+            PaperEmbedding.objects.bulk_update(batch, ['vector', 'dim'])
+            batch = []
+    if batch:
+        PaperEmbedding.objects.bulk_update(batch, ['vector', 'dim'])
+
+
+def binary_to_json(apps, schema_editor):
+    PaperEmbedding = apps.get_model('ml_engine', 'PaperEmbedding')
+    batch = []
+    for pe in PaperEmbedding.objects.exclude(vector__isnull=True).only('id', 'vector').iterator(chunk_size=1000):
+        pe.embedding = np.frombuffer(pe.vector, dtype='<f4').tolist()
+        batch.append(pe)
+        if len(batch) >= 1000:
+            PaperEmbedding.objects.bulk_update(batch, ['embedding'])
+            batch = []
+    if batch:
+        PaperEmbedding.objects.bulk_update(batch, ['embedding'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_engine', '0004_paperembedding_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paperembedding',
+            name='vector',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='paperembedding',
+            name='dim',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(json_to_binary, binary_to_json),
+    ]
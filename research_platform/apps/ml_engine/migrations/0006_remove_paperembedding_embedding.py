@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_engine', '0005_paperembedding_vector'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='paperembedding',
+            name='embedding',
+        ),
+    ]
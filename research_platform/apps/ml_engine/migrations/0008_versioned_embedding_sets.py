@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def activate_current_set(apps, schema_editor):
+    """Register the set existing embeddings belong to as the active RecommendationModel."""
+    PaperEmbedding = apps.get_model('ml_engine', 'PaperEmbedding')
+    RecommendationModel = apps.get_model('ml_engine', 'RecommendationModel')
+    current = (
+        PaperEmbedding.objects.values('model_version').annotate(n=Count('id')).order_by('-n')
+        .values_list('model_version', flat=True).first()
+    ) or 'bert-mini-v1'
+    model_name = getattr(settings, 'ML_EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+    row = RecommendationModel.objects.filter(version=current).first()
+    if row is None:
+        row = RecommendationModel.objects.create(
+            name=model_name, version=current, model_path=model_name, is_active=True,
+        )
+    RecommendationModel.objects.exclude(pk=row.pk).update(is_active=False)
+    RecommendationModel.objects.filter(pk=row.pk).update(is_active=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_engine', '0007_userprofilevector'),
+        ('papers', '0013_relatedpaper_score_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paperembedding',
+            name='model_version',
+            field=models.CharField(db_index=True, default='tfidf-v1', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='paperembedding',
+            name='paper',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='papers.paper'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='paperembedding',
+            unique_together={('paper', 'model_version')},
+        ),
+        migrations.RunPython(activate_current_set, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_engine', '0008_versioned_embedding_sets'),
+        ('papers', '0013_relatedpaper_score_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularityPrior',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paper_ids', models.BinaryField()),
+                ('scores', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='popularity_prior', to='papers.category')),
+            ],
+        ),
+    ]
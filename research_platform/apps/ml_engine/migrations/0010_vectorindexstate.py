@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_engine', '0009_popularityprior'),
+        ('papers', '0013_relatedpaper_score_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VectorIndexState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_fingerprint', models.CharField(max_length=64)),
+                ('text_hash', models.CharField(max_length=64)),
+                ('chunker_version', models.CharField(max_length=50)),
+                ('model_name', models.CharField(max_length=200)),
+                ('chunk_ids', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('paper', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='vector_index_state', to='papers.paper')),
+            ],
+        ),
+    ]
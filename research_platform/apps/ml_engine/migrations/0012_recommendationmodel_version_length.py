@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_engine', '0011_embeddingsversion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recommendationmodel',
+            name='version',
+            field=models.CharField(max_length=50),
+        ),
+    ]
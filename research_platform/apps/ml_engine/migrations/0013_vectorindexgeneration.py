@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:51
+
+from django.db import migrations, models
+
+
+def create_counter(apps, schema_editor):
+    apps.get_model('ml_engine', 'VectorIndexGeneration').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_engine', '0012_recommendationmodel_version_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VectorIndexGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('counter', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,209 @@
+"""
+Process-wide registry of SentenceTransformer models.
+
+Both the recommendation engine and the ChromaDB vector store encode text with
+the same model, so it is loaded once per process on first use and shared.
+The RAG re-rank cross-encoder is kept here too. Set
+``ML_WARMUP_MODELS=True`` to load them in the background at start-up
+instead of on the first request.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILES = ('sentence_bert_config.json', 'tokenizer_config.json')
+
+_models = {}
+_load_stats = {}
+_lowercase = {}  # model name -> whether it lowercases its input
+_lock = threading.Lock()
+
+
+def default_model_name() -> str:
+    return getattr(settings, 'ML_EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+
+
+def _rss_mb() -> float:
+    """Current resident memory of this process in MiB (peak RSS where neither /proc nor psutil exists)."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2 ** 20
+    except ImportError:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def _get_or_load(key: str, factory):
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            rss_before = _rss_mb()
+            started = time.perf_counter()
+            model = factory()
+            _load_stats[key] = {
+                'load_seconds': round(time.perf_counter() - started, 3),
+                'rss_mb': round(_rss_mb(), 1),
+                'rss_delta_mb': round(_rss_mb() - rss_before, 1),
+            }
+            _models[key] = model
+            logger.info(
+                "Loaded model %s in %.2fs (RSS %.0f MiB, +%.0f MiB)",
+                key,
+                _load_stats[key]['load_seconds'],
+                _load_stats[key]['rss_mb'],
+                _load_stats[key]['rss_delta_mb'],
+            )
+    return model
+
+
+def get_sentence_model(name: str = None):
+    """Return the shared SentenceTransformer for *name*, loading it once."""
+    name = name or default_model_name()
+
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(name)
+
+    return _get_or_load(name, load)
+
+
+def _model_lowercases(model) -> bool:
+    module = next(iter(model), None) if hasattr(model, '__iter__') else None
+    if getattr(module, 'do_lower_case', False):
+        return True
+    tokenizer = getattr(model, 'tokenizer', None)
+    return bool(
+        getattr(tokenizer, 'do_lower_case', False)
+        or getattr(tokenizer, 'init_kwargs', {}).get('do_lower_case', False)
+    )
+
+
+def _config_lowercases(name: str):
+    """``do_lower_case`` from the model's config files on disk, or None if none are available locally."""
+    candidates = [Path(name) / filename for filename in CONFIG_FILES]
+    try:
+        from huggingface_hub import try_to_load_from_cache
+    except ImportError:
+        pass
+    else:
+        for repo_id in (name, f'sentence-transformers/{name}'):
+            for filename in CONFIG_FILES:
+                try:
+                    cached = try_to_load_from_cache(repo_id, filename)
+                except ValueError:  # not a valid repo id (e.g. a local path)
+                    continue
+                if isinstance(cached, str):
+                    candidates.append(Path(cached))
+    found = None
+    for path in candidates:
+        try:
+            config = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        found = found or bool(config.get('do_lower_case', False))
+    return found
+
+
+def lowercases_input(name: str = None) -> bool:
+    """
+    Whether sentence model *name* folds text to lower case, so case never changes its embeddings.
+
+    ``settings.ML_EMBEDDING_LOWERCASE`` decides when set. Otherwise the
+    answer comes from the loaded model or its config files, never from
+    loading the model; while neither is available it is False.
+    """
+    configured = getattr(settings, 'ML_EMBEDDING_LOWERCASE', None)
+    if configured is not None:
+        return configured
+    name = name or default_model_name()
+    value = _lowercase.get(name)
+    if value is not None:
+        return value
+    model = _models.get(name)
+    value = _model_lowercases(model) if model is not None else _config_lowercases(name)
+    if value is None:
+        return False  # asked again once the model has been loaded
+    _lowercase[name] = value
+    return value
+
+
+def default_cross_encoder_name() -> str:
+    return getattr(settings, 'ML_RAG_RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+
+
+def _cross_encoder_key(name: str) -> str:
+    return f'cross-encoder:{name}'
+
+
+def get_cross_encoder(name: str = None):
+    """Return the shared CPU CrossEncoder for *name* (used to re-rank RAG chunks), loading it once."""
+    name = name or default_cross_encoder_name()
+
+    def load():
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(name, device='cpu')
+
+    return _get_or_load(_cross_encoder_key(name), load)
+
+
+def cross_encoder_loaded(name: str = None) -> bool:
+    return _cross_encoder_key(name or default_cross_encoder_name()) in _models
+
+
+def warm_up(names=None, background=True):
+    """Load models ahead of the first request, including the re-rank cross-encoder when it is enabled."""
+    names = names or [default_model_name()]
+
+    def _load_all():
+        for name in names:
+            try:
+                get_sentence_model(name)
+            except Exception as exc:
+                logger.error("Model warm-up failed for %s: %s", name, exc)
+        if getattr(settings, 'ML_RAG_RERANK', False):
+            try:
+                get_cross_encoder()
+            except Exception as exc:
+                logger.error("Model warm-up failed for %s: %s", default_cross_encoder_name(), exc)
+
+    if background:
+        threading.Thread(target=_load_all, name='ml-model-warmup', daemon=True).start()
+    else:
+        _load_all()
+
+
+def stats() -> dict:
+    """Load time and memory figures for every model loaded in this process."""
+    return {
+        'models': {name: dict(values) for name, values in _load_stats.items()},
+        'rss_mb': round(_rss_mb(), 1),
+    }
+
+
+class SharedEmbeddingFunction:
+    """ChromaDB embedding function backed by the process's encoder (see encoders.get_encoder)."""
+
+    def __init__(self, model_name: str = None):
+        self.model_name = model_name or default_model_name()
+
+    def __call__(self, input):
+        from .encoders import get_encoder
+        return get_encoder(self.model_name).encode(input).tolist()
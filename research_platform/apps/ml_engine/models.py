@@ -1,6 +1,7 @@
 from django.db import models
 from apps.accounts.models import User
-from apps.papers.models import Paper
+from apps.papers.models import Category, Paper
+from .embeddings import from_bytes, to_bytes
 
 
 class UserRecommendation(models.Model):
@@ -17,14 +18,89 @@ class UserRecommendation(models.Model):
 
 class RecommendationModel(models.Model):
     name = models.CharField(max_length=100)
-    version = models.CharField(max_length=20)
+    version = models.CharField(max_length=50)  # matches PaperEmbedding.model_version
     model_path = models.CharField(max_length=500)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
 
+class EmbeddingsVersion(models.Model):
+    """
+    Single-row counter bumped whenever embeddings are written or the active set changes.
+
+    Every process compares it with the version of its cached embedding
+    matrix, so it lives in the database rather than in a per-process cache.
+    """
+    counter = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class VectorIndexGeneration(models.Model):
+    """
+    Single-row counter bumped whenever chunks in the vector store change.
+
+    It is part of every cached search result key, so a bump from a
+    management command or another worker invalidates the results cached by
+    every web process.
+    """
+    counter = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
 class PaperEmbedding(models.Model):
-    paper = models.OneToOneField(Paper, on_delete=models.CASCADE)
-    embedding = models.JSONField(default=list)  # JSON array for vector
-    model_version = models.CharField(max_length=50, default='tfidf-v1')
+    paper = models.ForeignKey(Paper, on_delete=models.CASCADE, related_name='embeddings')
+    vector = models.BinaryField(null=True)  # raw float32 bytes, see embeddings.py
+    dim = models.PositiveSmallIntegerField(default=0)
+    # embedding set this row belongs to; the active set is chosen by RecommendationModel, see versions.py
+    model_version = models.CharField(max_length=50, default='tfidf-v1', db_index=True)
+    content_hash = models.CharField(max_length=64, blank=True, default='')  # sha256 of the encoded text
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('paper', 'model_version')
+
+    @property
+    def embedding(self):
+        return from_bytes(self.vector) if self.vector is not None else None
+
+    @embedding.setter
+    def embedding(self, value):
+        self.vector = to_bytes(value)
+        self.dim = len(value)
+
+
+class UserProfileVector(models.Model):
+    """Running sum of the normalised embeddings of papers a user liked or bookmarked."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile_vector')
+    vector_sum = models.BinaryField(null=True)  # raw float32 bytes, see embeddings.py
+    count = models.PositiveIntegerField(default=0)
+    model_version = models.CharField(max_length=50)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def vector(self):
+        """Mean profile vector, or None if no liked paper has an embedding."""
+        if not self.count or self.vector_sum is None:
+            return None
+        return from_bytes(self.vector_sum) / self.count
+
+
+class PopularityPrior(models.Model):
+    """Most popular approved papers of one category, or of all papers when ``category`` is null."""
+    category = models.OneToOneField(
+        Category, null=True, blank=True, on_delete=models.CASCADE, related_name='popularity_prior'
+    )
+    paper_ids = models.BinaryField()  # int64 bytes, best first
+    scores = models.BinaryField()     # float32 bytes, aligned with paper_ids
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class VectorIndexState(models.Model):
+    """What is currently indexed for a paper in the ChromaDB vector store, see vector_store.py."""
+    paper = models.OneToOneField(Paper, on_delete=models.CASCADE, related_name='vector_index_state')
+    source_fingerprint = models.CharField(max_length=64)  # sha256 of the metadata fields and PDF name/size/mtime
+    text_hash = models.CharField(max_length=64)           # sha256 of the extracted text
+    chunker_version = models.CharField(max_length=50)
+    model_name = models.CharField(max_length=200)
+    chunk_ids = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
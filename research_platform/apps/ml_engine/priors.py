@@ -0,0 +1,306 @@
+"""
+Precomputed popularity priors for cold-start users.
+
+``build_priors`` scores every approved paper once, from views, downloads and
+ratings/bookmarks of the last ``ML_PRIORS_TRENDING_DAYS`` days, and stores
+the top ``ML_PRIORS_TOP_N`` papers overall and per category. Each list is a
+single ``PopularityPrior`` row holding packed id and score arrays.
+
+Each process keeps the rows in memory. It reloads them every
+``ML_PRIORS_REFRESH_SECONDS`` (every minute while none have been built) and
+queues a background rebuild when the stored rows are older than that. A user
+without a profile vector then gets the global list, blended with the lists
+of the categories that match their research-interest tags and
+``UserProfile.research_interests``, minus the papers they have already rated
+or bookmarked. No paper table sort runs on the request path.
+"""
+import datetime
+import logging
+import re
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+VIEW_WEIGHT = 1.0
+DOWNLOAD_WEIGHT = 2.0
+RECENT_WEIGHT = 5.0      # per rating or bookmark inside the trending window
+GLOBAL_WEIGHT = 0.5      # share of the global list when category lists are blended in
+EMPTY_RECHECK_SECONDS = 60  # reload interval while no priors have been built yet
+
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def _tokens(text):
+    return frozenset(_WORD.findall(text.lower()))
+
+
+def _refresh_seconds():
+    return getattr(settings, 'ML_PRIORS_REFRESH_SECONDS', 3600)
+
+
+class Priors:
+    def __init__(self, lists, category_names, updated_at=None):
+        self.lists = lists                    # category id (None = global) -> (paper_ids, scores)
+        self.category_names = category_names  # lower-cased name -> category id
+        self.category_tokens = [(_tokens(name), cid) for name, cid in category_names.items()]
+        self.updated_at = updated_at
+        self.loaded_at = time.monotonic()
+
+    def __bool__(self):
+        return None in self.lists
+
+    def categories_for(self, interests):
+        """
+        Category ids whose name matches one of the interest terms.
+
+        A term matches a category with the same name, or one whose name
+        contains all of the term's words or all of whose words the term
+        contains ("learning" ~ "Machine Learning"); words are compared
+        whole, so "ml" does not match "HTML".
+        """
+        matched = set()
+        for term in interests:
+            category_id = self.category_names.get(term)
+            if category_id is not None:
+                matched.add(category_id)
+                continue
+            words = _tokens(term)
+            if words:
+                matched.update(cid for tokens, cid in self.category_tokens if words <= tokens or tokens <= words)
+        return [cid for cid in matched if cid in self.lists]
+
+    def recommend(self, interests=(), top_k=10, exclude_ids=()):
+        """``[(paper_id, score), ...]`` from the global list blended with matching category lists."""
+        if not self:
+            return []
+        categories = self.categories_for(interests)
+        lists = [(None, 1.0 if not categories else GLOBAL_WEIGHT)] + [(cid, 1.0) for cid in categories]
+        blended = {}
+        for key, weight in lists:
+            paper_ids, scores = self.lists[key]
+            if not len(scores):
+                continue
+            top = scores[0] or 1.0
+            for pid, score in zip(paper_ids.tolist(), (scores / top * weight).tolist()):
+                blended[pid] = blended.get(pid, 0.0) + score
+        for pid in exclude_ids:
+            blended.pop(pid, None)
+        ranked = sorted(blended.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:top_k]
+
+
+def build_priors(top_n=None):
+    """Recompute and store the global and per-category priors; returns the number of lists stored."""
+    from apps.papers.models import Bookmark, Paper, PaperCategory, Rating
+    from .models import PopularityPrior
+
+    top_n = top_n or getattr(settings, 'ML_PRIORS_TOP_N', 200)
+    started = time.perf_counter()
+    rows = np.array(
+        list(Paper.objects.filter(is_approved=True).order_by('id').values_list(
+            'id', 'view_count', 'download_count'
+        )),
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    paper_ids = rows[:, 0]
+    scores = VIEW_WEIGHT * rows[:, 1] + DOWNLOAD_WEIGHT * rows[:, 2]
+
+    since = timezone.now() - datetime.timedelta(days=getattr(settings, 'ML_PRIORS_TRENDING_DAYS', 30))
+    for model in (Rating, Bookmark):
+        recent = model.objects.filter(created_at__gte=since).values('paper_id').annotate(n=Count('id'))
+        recent = np.array([(row['paper_id'], row['n']) for row in recent], dtype=np.int64).reshape(-1, 2)
+        positions = np.searchsorted(paper_ids, recent[:, 0])
+        positions = np.minimum(positions, max(len(paper_ids) - 1, 0))
+        found = paper_ids[positions] == recent[:, 0] if len(paper_ids) else np.zeros(0, dtype=bool)
+        np.add.at(scores, positions[found], RECENT_WEIGHT * recent[found, 1])
+    scores = scores.astype(np.float32)
+
+    def top(rows_idx):
+        k = min(top_n, len(rows_idx))
+        if not k:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        best = rows_idx[np.argpartition(-scores[rows_idx], k - 1)[:k]]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return paper_ids[best], scores[best]
+
+    memberships = np.array(
+        list(PaperCategory.objects.values_list('category_id', 'paper_id')), dtype=np.int64
+    ).reshape(-1, 2)
+    positions = np.searchsorted(paper_ids, memberships[:, 1])
+    positions = np.minimum(positions, max(len(paper_ids) - 1, 0))
+    valid = paper_ids[positions] == memberships[:, 1] if len(paper_ids) else np.zeros(0, dtype=bool)
+    memberships, positions = memberships[valid], positions[valid]
+
+    priors = [PopularityPrior(category_id=None, **_pack(*top(np.arange(len(paper_ids)))))]
+    for category_id in np.unique(memberships[:, 0]).tolist():
+        priors.append(PopularityPrior(
+            category_id=category_id, **_pack(*top(positions[memberships[:, 0] == category_id]))
+        ))
+    with transaction.atomic():
+        PopularityPrior.objects.all().delete()
+        PopularityPrior.objects.bulk_create(priors)
+
+    logger.info(
+        "Built popularity priors: %d papers, %d category lists in %.2fs",
+        len(paper_ids), len(priors) - 1, time.perf_counter() - started,
+    )
+    return len(priors)
+
+
+def _pack(paper_ids, scores):
+    return {
+        'paper_ids': np.ascontiguousarray(paper_ids, dtype='<i8').tobytes(),
+        'scores': np.ascontiguousarray(scores, dtype='<f4').tobytes(),
+    }
+
+
+def load_priors():
+    from apps.papers.models import Category
+    from .models import PopularityPrior
+
+    lists, updated_at = {}, None
+    for prior in PopularityPrior.objects.all():
+        lists[prior.category_id] = (
+            np.frombuffer(prior.paper_ids, dtype='<i8'), np.frombuffer(prior.scores, dtype='<f4'),
+        )
+        if prior.category_id is None:
+            updated_at = prior.updated_at
+    category_names = {
+        name.lower(): cid for cid, name in Category.objects.filter(
+            id__in=[cid for cid in lists if cid is not None]
+        ).values_list('id', 'name')
+    }
+    return Priors(lists, category_names, updated_at)
+
+
+_priors = None
+_lock = threading.Lock()
+_rebuilding = threading.Event()
+
+
+def _rebuild():
+    global _priors
+    try:
+        build_priors()
+        _priors = None  # reload the new rows on the next request
+    except Exception as exc:
+        logger.error("Popularity prior rebuild failed: %s", exc)
+    finally:
+        _rebuilding.clear()
+
+
+def schedule_rebuild():
+    """Queue a background rebuild unless one is already running."""
+    from apps.papers.background import executor
+
+    if not _rebuilding.is_set():
+        _rebuilding.set()
+        executor.submit(_rebuild)
+
+
+def _is_fresh(loaded, max_age):
+    if loaded is None:
+        return False
+    if not loaded:
+        # another process may be building them; do not serve "no priors" for the whole window
+        max_age = min(max_age, EMPTY_RECHECK_SECONDS)
+    return time.monotonic() - loaded.loaded_at < max_age
+
+
+def _stale(loaded):
+    stale_before = timezone.now() - datetime.timedelta(seconds=_refresh_seconds())
+    return loaded.updated_at is None or loaded.updated_at < stale_before
+
+
+def get_priors(max_age=None, schedule=True):
+    """
+    Return the in-memory priors, reloading them once they are older than the refresh window.
+
+    Stale rows queue a background rebuild unless *schedule* is False.
+    """
+    global _priors
+    max_age = max_age if max_age is not None else _refresh_seconds()
+    loaded = _priors
+    if _is_fresh(loaded, max_age):
+        return loaded
+    with _lock:
+        if not _is_fresh(_priors, max_age):
+            _priors = load_priors()
+            if schedule and _stale(_priors):
+                schedule_rebuild()
+    return _priors
+
+
+def current_priors():
+    """
+    Priors for batch jobs: rebuilt in the calling thread when stale.
+
+    Never queues a background write, which on SQLite would lock the
+    database under the job's own writes.
+    """
+    global _priors
+    loaded = get_priors(schedule=False)
+    if not _stale(loaded):
+        return loaded
+    build_priors()
+    with _lock:
+        _priors = load_priors()
+        return _priors
+
+
+_SPLIT = re.compile(r'[,;/\n|]+')
+
+
+def _terms(text):
+    return {term.strip().lower() for term in _SPLIT.split(text or '') if term.strip()}
+
+
+def interests_for(user_id):
+    """Lower-cased interest terms from the user's tags and free-text research interests."""
+    return interests_for_users([user_id]).get(user_id, set())
+
+
+def interests_for_users(user_ids):
+    from apps.accounts.models import UserProfile, UserResearchInterest
+
+    interests = {}
+    for user_id, name in UserResearchInterest.objects.filter(user_id__in=user_ids).values_list(
+        'user_id', 'tag__name'
+    ):
+        interests.setdefault(user_id, set()).add(name.lower())
+    for user_id, text in UserProfile.objects.filter(user_id__in=user_ids).exclude(
+        research_interests=''
+    ).values_list('user_id', 'research_interests'):
+        interests.setdefault(user_id, set()).update(_terms(text))
+    return interests
+
+
+def seen_by_users(user_ids):
+    """``{user_id: {paper_id, ...}}`` of the papers each user has rated or bookmarked."""
+    from apps.papers.models import Bookmark, Rating
+
+    seen = {}
+    for model in (Rating, Bookmark):
+        for user_id, paper_id in model.objects.filter(user_id__in=user_ids).values_list('user_id', 'paper_id'):
+            seen.setdefault(user_id, set()).add(paper_id)
+    return seen
+
+
+def cold_start_scores(user_id, top_k=10, interests=None, exclude_ids=None):
+    """Cold-start ``[(paper_id, score), ...]`` for a user, or [] before priors have been built."""
+    priors = get_priors()
+    if not priors:
+        return []
+    if interests is None:
+        interests = interests_for(user_id)
+    if exclude_ids is None:
+        exclude_ids = seen_by_users([user_id]).get(user_id, ())
+    return priors.recommend(interests, top_k, exclude_ids)
@@ -0,0 +1,99 @@
+"""
+Persistent user profile vectors.
+
+A user's profile is the mean of the L2-normalised embeddings of the papers
+they rated 4+ or bookmarked. ``UserProfileVector`` stores the running sum
+and count so a new rating or bookmark is applied in O(dim) from the paper
+signals. The profile is recomputed from scratch only when it is missing,
+when the active embedding set changes, or after one of the user's papers
+is encoded or re-encoded (see ``invalidate_for_papers``).
+"""
+import numpy as np
+from django.db import transaction
+
+from apps.papers.models import Bookmark, Rating
+from .embeddings import from_bytes, load_matrix, to_bytes
+from .models import UserProfileVector
+from .versions import active_embeddings, active_version
+
+
+def _normalised(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def liked_paper_ids(user_id):
+    return set(
+        Rating.objects.filter(user_id=user_id, rating__gte=4).values_list('paper_id', flat=True)
+    ) | set(
+        Bookmark.objects.filter(user_id=user_id).values_list('paper_id', flat=True)
+    )
+
+
+def rebuild_profile(user_id):
+    """Recompute a user's profile from their full history and store it."""
+    _, matrix = load_matrix(active_embeddings().filter(paper_id__in=liked_paper_ids(user_id)))
+    vector_sum = _normalised(matrix).sum(axis=0) if len(matrix) else None
+    profile, _ = UserProfileVector.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            'vector_sum': to_bytes(vector_sum) if vector_sum is not None else None,
+            'count': len(matrix),
+            'model_version': active_version(),
+        },
+    )
+    return profile
+
+
+def get_profile_vector(user_id):
+    """Return the user's mean profile vector, or None if they have no liked papers with embeddings."""
+    profile = UserProfileVector.objects.filter(user_id=user_id).first()
+    if profile is None or profile.model_version != active_version():
+        profile = rebuild_profile(user_id)
+    return profile.vector
+
+
+def paper_liked_changed(user_id, paper_id, liked):
+    """
+    Add (*liked* True) or remove a paper's embedding from the stored profile.
+
+    Callers only invoke this when the paper actually enters or leaves the
+    user's liked-or-bookmarked set.
+    """
+    blob = active_embeddings().filter(paper_id=paper_id).values_list('vector', flat=True).first()
+    with transaction.atomic():
+        profile = UserProfileVector.objects.select_for_update().filter(user_id=user_id).first()
+        if profile is None or profile.model_version != active_version():
+            rebuild_profile(user_id)
+            return
+        if blob is None:
+            if not liked:
+                # the embedding may have gone first in a Paper delete cascade, so what the
+                # sum holds for this paper is unknown; recount from the remaining history
+                rebuild_profile(user_id)
+            return  # otherwise the paper is not embedded yet and never was part of the sum
+        vector = _normalised(from_bytes(blob)[np.newaxis, :])[0]
+        if profile.vector_sum is None:
+            current = np.zeros_like(vector)
+        else:
+            current = from_bytes(profile.vector_sum)
+        if liked:
+            profile.vector_sum = to_bytes(current + vector)
+            profile.count += 1
+        else:
+            profile.count = max(profile.count - 1, 0)
+            profile.vector_sum = to_bytes(current - vector) if profile.count else None
+        profile.save(update_fields=['vector_sum', 'count', 'updated_at'])
+
+
+def invalidate_for_papers(paper_ids):
+    """Drop stored profiles that include any of *paper_ids*; they are rebuilt on next use."""
+    if not paper_ids:
+        return
+    user_ids = set(
+        Rating.objects.filter(paper_id__in=paper_ids, rating__gte=4).values_list('user_id', flat=True)
+    ) | set(
+        Bookmark.objects.filter(paper_id__in=paper_ids).values_list('user_id', flat=True)
+    )
+    UserProfileVector.objects.filter(user_id__in=user_ids).delete()
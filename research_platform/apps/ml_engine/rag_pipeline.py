@@ -1,13 +1,19 @@
 """
 LangGraph RAG pipeline for Yggdrasil AI chatbot.
 
-Graph:  retrieve  →  generate  →  END
+Graph:  retrieve  →  rerank  →  generate  →  END
 
 - retrieve : semantic search over ChromaDB paper chunks
+- rerank   : optional cross-encoder re-ranking of over-fetched chunks under a
+             token budget and deadline (see reranker; ML_RAG_RERANK)
 - generate : call Claude Haiku with retrieved context
+
+``query_rag`` runs the graph synchronously; ``astream_rag`` runs the same
+steps asynchronously and streams the answer token by token.
 """
+import asyncio
 import logging
-from typing import List, TypedDict
+from typing import AsyncIterator, List, TypedDict
 
 logger = logging.getLogger(__name__)
 
@@ -16,8 +22,10 @@ logger = logging.getLogger(__name__)
 # State schema
 # ---------------------------------------------------------------------------
 
-class RAGState(TypedDict):
+class RAGState(TypedDict, total=False):
     query: str
+    search_mode: str
+    rerank: bool
     retrieved_docs: List[dict]
     response: str
     sources: List[dict]
@@ -27,36 +35,59 @@ class RAGState(TypedDict):
 # Node: retrieve
 # ---------------------------------------------------------------------------
 
+def _rerank_enabled(state: RAGState) -> bool:
+    from django.conf import settings
+
+    enabled = state.get("rerank")
+    return getattr(settings, 'ML_RAG_RERANK', False) if enabled is None else enabled
+
+
 def _retrieve(state: RAGState) -> RAGState:
+    from django.conf import settings
     from .vector_store import search_papers
 
-    docs = search_papers(state["query"], n_results=5)
+    if _rerank_enabled(state):
+        n_results = getattr(settings, 'ML_RAG_RERANK_CANDIDATES', 20)  # over-fetch for the re-ranker
+    else:
+        n_results = getattr(settings, 'ML_RAG_CONTEXT_CHUNKS', 5)
+    docs = search_papers(state["query"], n_results=n_results, mode=state.get("search_mode"))
     return {**state, "retrieved_docs": docs}
 
 
+# ---------------------------------------------------------------------------
+# Node: rerank
+# ---------------------------------------------------------------------------
+
+def _rerank(state: RAGState) -> RAGState:
+    if not _rerank_enabled(state):
+        return state
+    from .reranker import rerank
+
+    return {**state, "retrieved_docs": rerank(state["query"], state["retrieved_docs"])}
+
+
 # ---------------------------------------------------------------------------
 # Node: generate
 # ---------------------------------------------------------------------------
 
-def _generate(state: RAGState) -> RAGState:
-    from langchain_openai import ChatOpenAI
-    from langchain_core.messages import HumanMessage, SystemMessage
+NO_DOCS_RESPONSE = (
+    "I couldn't find relevant research papers on that topic in the platform. "
+    "Try rephrasing your question, or more papers may need to be uploaded and approved."
+)
+ERROR_RESPONSE = "I encountered an error generating a response. Please try again shortly."
 
-    docs = state["retrieved_docs"]
-    query = state["query"]
+SYSTEM_PROMPT = (
+    "You are Yggdrasil, an AI research assistant for the Orravyn research platform. "
+    "Answer the researcher's question using only the provided context excerpts from "
+    "research papers stored on the platform. "
+    "Be precise and academic. Cite specific claims when the context supports it. "
+    "If the context does not contain enough information to answer fully, say so clearly "
+    "rather than speculating. Do not fabricate facts or references."
+)
 
-    if not docs:
-        return {
-            **state,
-            "response": (
-                "I couldn't find relevant research papers on that topic in the platform. "
-                "Try rephrasing your question, or more papers may need to be uploaded and approved."
-            ),
-            "sources": [],
-        }
 
-    # Build context and deduplicated sources list
-    context = "\n\n---\n\n".join(doc["content"] for doc in docs)
+def _sources(docs: List[dict]) -> List[dict]:
+    """Deduplicated source papers of the retrieved chunks, in retrieval order."""
     seen_ids: set = set()
     sources: List[dict] = []
     for doc in docs:
@@ -70,34 +101,37 @@ def _generate(state: RAGState) -> RAGState:
                     "authors": doc["metadata"].get("authors", ""),
                 }
             )
+    return sources
 
-    system_prompt = (
-        "You are Yggdrasil, an AI research assistant for the Orravyn research platform. "
-        "Answer the researcher's question using only the provided context excerpts from "
-        "research papers stored on the platform. "
-        "Be precise and academic. Cite specific claims when the context supports it. "
-        "If the context does not contain enough information to answer fully, say so clearly "
-        "rather than speculating. Do not fabricate facts or references."
-    )
 
-    messages = [
-        SystemMessage(content=system_prompt),
+def _messages(query: str, docs: List[dict]):
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    context = "\n\n---\n\n".join(doc["content"] for doc in docs)
+    return [
+        SystemMessage(content=SYSTEM_PROMPT),
         HumanMessage(
             content=f"Context from research papers:\n\n{context}\n\nResearcher's question: {query}"
         ),
     ]
 
+
+def _llm(**kwargs):
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model="gpt-4o-mini", max_tokens=1024, **kwargs)
+
+
+def _generate(state: RAGState) -> RAGState:
+    docs = state["retrieved_docs"]
+    if not docs:
+        return {**state, "response": NO_DOCS_RESPONSE, "sources": []}
+
     try:
-        llm = ChatOpenAI(model="gpt-4o-mini", max_tokens=1024)
-        reply = llm.invoke(messages)
-        return {**state, "response": reply.content, "sources": sources}
+        reply = _llm().invoke(_messages(state["query"], docs))
+        return {**state, "response": reply.content, "sources": _sources(docs)}
     except Exception as exc:
         logger.error("LLM generation failed: %s", exc)
-        return {
-            **state,
-            "response": "I encountered an error generating a response. Please try again shortly.",
-            "sources": [],
-        }
+        return {**state, "response": ERROR_RESPONSE, "sources": []}
 
 
 # ---------------------------------------------------------------------------
@@ -112,9 +146,11 @@ def _build_graph():
 
     graph = StateGraph(RAGState)
     graph.add_node("retrieve", _retrieve)
+    graph.add_node("rerank", _rerank)
     graph.add_node("generate", _generate)
     graph.set_entry_point("retrieve")
-    graph.add_edge("retrieve", "generate")
+    graph.add_edge("retrieve", "rerank")
+    graph.add_edge("rerank", "generate")
     graph.add_edge("generate", END)
     return graph.compile()
 
@@ -130,10 +166,14 @@ def _get_graph():
 # Public API
 # ---------------------------------------------------------------------------
 
-def query_rag(user_query: str) -> dict:
+def query_rag(user_query: str, search_mode: str = None, rerank: bool = None) -> dict:
     """
     Run the RAG pipeline for a user query.
 
+    *search_mode* picks the retriever for this query ('dense', 'lexical' or
+    'hybrid'; see vector_store.search_papers) and *rerank* overrides
+    ``settings.ML_RAG_RERANK``.
+
     Returns:
         {
             "response": str,
@@ -144,9 +184,49 @@ def query_rag(user_query: str) -> dict:
     result = graph.invoke(
         {
             "query": user_query,
+            "search_mode": search_mode,
+            "rerank": rerank,
             "retrieved_docs": [],
             "response": "",
             "sources": [],
         }
     )
     return {"response": result["response"], "sources": result["sources"]}
+
+
+async def astream_rag(user_query: str, search_mode: str = None, rerank: bool = None) -> AsyncIterator[dict]:
+    """
+    Async, streaming variant of ``query_rag`` for ASGI views.
+
+    Runs the same retrieve, rerank and generate steps without holding a
+    thread for the LLM call: retrieval and re-ranking run in a worker
+    thread, then tokens are streamed from the model as they arrive. Yields,
+    in order::
+
+        {"event": "sources", "sources": [...]}
+        {"event": "token", "text": str}          # repeated
+        {"event": "done", "response": str, "sources": [...]}
+    """
+    state = {"query": user_query, "search_mode": search_mode, "rerank": rerank}
+    docs = (await asyncio.to_thread(lambda: _rerank(_retrieve(state))))["retrieved_docs"]
+    sources = _sources(docs)
+    yield {"event": "sources", "sources": sources}
+
+    if not docs:
+        yield {"event": "token", "text": NO_DOCS_RESPONSE}
+        yield {"event": "done", "response": NO_DOCS_RESPONSE, "sources": []}
+        return
+
+    parts: List[str] = []
+    try:
+        async for chunk in _llm(streaming=True).astream(_messages(user_query, docs)):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield {"event": "token", "text": chunk.content}
+    except Exception as exc:
+        logger.error("LLM generation failed: %s", exc)
+        if not parts:
+            yield {"event": "token", "text": ERROR_RESPONSE}
+            yield {"event": "done", "response": ERROR_RESPONSE, "sources": []}
+            return
+    yield {"event": "done", "response": "".join(parts), "sources": sources}
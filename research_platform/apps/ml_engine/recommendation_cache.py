@@ -0,0 +1,62 @@
+"""
+Cached, serialised top-N recommendations per user.
+
+Page views read a user's recommendations from Django's cache, which is
+Redis when ``USE_REDIS_CACHE`` is set and local memory otherwise. On a miss
+the list is rebuilt from the stored ``UserRecommendation`` rows with a
+single query. Reads never run the model. Entries expire after
+``settings.ML_RECOMMENDATION_CACHE_TTL`` seconds, and
+``write_recommendations`` drops them as soon as a refresh commits.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from apps.papers.models import Category
+from .models import UserRecommendation
+
+TOP_N = 10
+KEY_PREFIX = 'ml_engine:recommendations:'
+
+
+def cache_key(user_id):
+    return f'{KEY_PREFIX}{user_id}'
+
+
+def _serialise(rec):
+    paper = rec.paper
+    return {
+        'paper': {
+            'pk': paper.pk,
+            'title': paper.title,
+            'authors': paper.authors,
+            'abstract': paper.abstract,
+            'created_at': paper.created_at,
+            'categories': [{'name': category.name} for category in paper.categories.all()],
+        },
+        'score': rec.score,
+        'reason': rec.reason,
+        'created_at': rec.created_at,
+    }
+
+
+def load(user_id):
+    """Serialise the user's stored top-N recommendations straight from the database."""
+    recs = UserRecommendation.objects.filter(user_id=user_id).select_related('paper').prefetch_related(
+        Prefetch('paper__categories', queryset=Category.objects.only('id', 'name'))
+    ).order_by('-score', 'id')[:TOP_N]
+    return [_serialise(rec) for rec in recs]
+
+
+def get_recommendations(user_id, limit=TOP_N):
+    """Cached serialised recommendations, best first; an empty list if none are stored yet."""
+    key = cache_key(user_id)
+    recommendations = cache.get(key)
+    if recommendations is None:
+        recommendations = load(user_id)
+        cache.set(key, recommendations, getattr(settings, 'ML_RECOMMENDATION_CACHE_TTL', 300))
+    return recommendations[:limit]
+
+
+def invalidate(user_ids):
+    cache.delete_many([cache_key(user_id) for user_id in user_ids])
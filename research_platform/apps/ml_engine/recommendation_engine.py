@@ -1,60 +1,260 @@
+import hashlib
+import logging
+import time
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from django.conf import settings
+from django.db import transaction
 from django.db.models import Count
 from apps.papers.models import Paper, Rating, Bookmark
 from apps.ml_engine.models import PaperEmbedding, UserRecommendation
+from apps.ml_engine import ann_index, collaborative, priors, profiles, recommendation_cache, versions
+from apps.ml_engine.embeddings import bump_version, get_embedding_matrix
+from apps.ml_engine.encoders import get_encoder
+from apps.ml_engine.model_registry import get_sentence_model
 from apps.accounts.models import User
 
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_SIZE = 500
+
+
+def paper_document(paper):
+    """Text that is encoded for a paper's embedding."""
+    return f"{paper.title} {paper.summary or ''} {paper.abstract or ''}"
+
+
+def content_hash(document):
+    return hashlib.sha256(document.encode('utf-8')).hexdigest()
+
+
+def write_recommendations(rows_by_user):
+    """
+    Atomically replace the stored recommendations of several users.
+
+    *rows_by_user* maps a user id to ``[(paper_id, score, reason), ...]``.
+    Rows whose score and reason are unchanged are left alone, changed ones are
+    updated with ``bulk_update``, new ones inserted with ``bulk_create`` and
+    dropped ones deleted, all in one transaction, so readers never see an
+    empty list mid-refresh. The users' cached lists are dropped once the
+    transaction commits. Returns counts and the elapsed time.
+    """
+    started = time.perf_counter()
+    created, updated, unchanged = [], [], 0
+    with transaction.atomic():
+        existing = {
+            (rec.user_id, rec.paper_id): rec
+            for rec in UserRecommendation.objects.select_for_update().filter(
+                user_id__in=list(rows_by_user)
+            ).only('id', 'user_id', 'paper_id', 'score', 'reason')
+        }
+        keep = set()
+        for user_id, rows in rows_by_user.items():
+            for paper_id, score, reason in rows:
+                key = (user_id, paper_id)
+                keep.add(key)
+                current = existing.get(key)
+                if current is None:
+                    created.append(UserRecommendation(
+                        user_id=user_id, paper_id=paper_id, score=score, reason=reason,
+                    ))
+                elif abs(current.score - score) > 1e-9 or current.reason != reason:
+                    current.score = score
+                    current.reason = reason
+                    updated.append(current)
+                else:
+                    unchanged += 1
+        stale = [rec.id for key, rec in existing.items() if key not in keep]
+
+        if stale:
+            UserRecommendation.objects.filter(id__in=stale).delete()
+        UserRecommendation.objects.bulk_update(updated, ['score', 'reason'], batch_size=WRITE_BATCH_SIZE)
+        # a concurrent refresh may have inserted the same pair first; its row is just as fresh
+        UserRecommendation.objects.bulk_create(created, batch_size=WRITE_BATCH_SIZE, ignore_conflicts=True)
+        user_ids = list(rows_by_user)
+        transaction.on_commit(lambda: recommendation_cache.invalidate(user_ids))
+
+    stats = {
+        'created': len(created),
+        'updated': len(updated),
+        'deleted': len(stale),
+        'unchanged': unchanged,
+        'seconds': round(time.perf_counter() - started, 4),
+    }
+    logger.info("Saved recommendations for %d users: %s", len(rows_by_user), stats)
+    return stats
+
 
 class ImprovedRecommendationEngine:
-    def __init__(self):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-
-    def build_embeddings(self):
-        papers = Paper.objects.filter(is_approved=True)
-        docs = [f"{p.title} {p.summary or ''} {p.abstract or ''}" for p in papers]
-        embeddings = self.model.encode(docs, convert_to_numpy=True)
-        for paper, emb in zip(papers, embeddings):
-            PaperEmbedding.objects.update_or_create(
-                paper=paper,
-                defaults={'embedding': emb.tolist(), 'model_version': 'bert-mini-v1'}
+    @property
+    def model(self):
+        return get_sentence_model()
+
+    def build_embeddings(self, paper_ids=None, full=False, batch_size=None, progress=None,
+                         encoder=None, model_version=None):
+        """
+        Encode approved papers and store their embeddings.
+
+        Embeddings go to the active set unless *model_version* names another
+        registered set (see ``versions``). A shadow set is written without
+        touching profiles, the ANN index or the cached matrix.
+
+        Papers are streamed from the database and handled *batch_size*
+        (default ``settings.ML_ENCODE_BATCH_SIZE``) at a time: each batch is
+        hashed, its stale papers encoded and written before the next batch is
+        read, so memory stays flat however large the corpus is. Only papers
+        whose title/summary/abstract hash differs from the stored embedding
+        in the set are re-encoded, unless *full* is set. Pass
+        *paper_ids* to restrict the build to specific papers, and *progress*
+        to receive ``(papers_seen, papers_encoded, elapsed_seconds)`` after
+        every batch. *encoder* defaults to ``encoders.get_encoder()`` for the
+        set's model; pass a ``ProcessEncoder`` to spread encoding over
+        several processes. Returns the number of papers encoded.
+        """
+        active = versions.active_version(fresh=True)
+        model_version = model_version or active
+        live = model_version == active
+        encoder = encoder or get_encoder(versions.model_name_for(model_version))
+        batch_size = batch_size or getattr(settings, 'ML_ENCODE_BATCH_SIZE', 256)
+        papers = Paper.objects.filter(is_approved=True).only(
+            'id', 'title', 'summary', 'abstract'
+        ).order_by('id')
+        if paper_ids is not None:
+            papers = papers.filter(id__in=paper_ids)
+
+        started = time.perf_counter()
+        seen = encoded = created = 0
+        batch = []
+
+        def flush():
+            nonlocal encoded, created
+            batch_encoded, batch_created = self._encode_batch(
+                batch, full, batch_size, encoder, model_version, live
+            )
+            encoded += batch_encoded
+            created += batch_created
+            batch.clear()
+            elapsed = time.perf_counter() - started
+            logger.debug(
+                "Embedding build: %d papers read, %d encoded, %.1f papers/s",
+                seen, encoded, seen / elapsed if elapsed else 0.0,
             )
+            if progress is not None:
+                progress(seen, encoded, elapsed)
 
-    def get_user_profile_vector(self, user):
-        paper_ids = list(
-            Rating.objects.filter(user=user, rating__gte=4).values_list('paper_id', flat=True)
-        ) + list(
-            Bookmark.objects.filter(user=user).values_list('paper_id', flat=True)
+        for paper in papers.iterator(chunk_size=batch_size):
+            batch.append(paper)
+            seen += 1
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+        if encoded and live:
+            bump_version()
+            ann_index.save_index(model_version)
+        elapsed = time.perf_counter() - started
+        logger.info(
+            "Encoded %d of %d papers into %s (%d new, %d updated) in %.1fs, %.1f papers/s",
+            encoded, seen, model_version, created, encoded - created,
+            elapsed, seen / elapsed if elapsed else 0.0,
         )
-        embeddings = PaperEmbedding.objects.filter(paper_id__in=paper_ids)
-        if not embeddings.exists():
-            return None
-        arr = np.array([np.array(e.embedding) for e in embeddings])
-        return arr.mean(axis=0)
+        return encoded
 
-    def content_based_recommend(self, user, top_k=10):
-        user_vec = self.get_user_profile_vector(user)
-        if user_vec is None:
-            popular = Paper.objects.filter(is_approved=True).order_by('-view_count')[:top_k]
-            return [(paper, paper.view_count) for paper in popular]
+    def _encode_batch(self, papers, full, batch_size, encoder, model_version, live):
+        """Encode and store the stale papers of one batch; returns ``(encoded, created)``."""
+        existing = {
+            row['paper_id']: row
+            for row in PaperEmbedding.objects.filter(
+                model_version=model_version, paper_id__in=[paper.id for paper in papers]
+            ).values('id', 'paper_id', 'content_hash')
+        }
+
+        stale = []
+        for paper in papers:
+            doc = paper_document(paper)
+            digest = content_hash(doc)
+            current = existing.get(paper.id)
+            if not full and current is not None and current['content_hash'] == digest:
+                continue
+            stale.append((paper.id, doc, digest))
+
+        if not stale:
+            return 0, 0
+
+        embeddings = encoder.encode([doc for _, doc, _ in stale], batch_size=batch_size)
+
+        to_create, to_update = [], []
+        for (paper_id, _, digest), emb in zip(stale, embeddings):
+            current = existing.get(paper_id)
+            embedding = PaperEmbedding(
+                id=current['id'] if current else None,
+                paper_id=paper_id,
+                embedding=emb,
+                model_version=model_version,
+                content_hash=digest,
+            )
+            (to_update if current else to_create).append(embedding)
+
+        # a concurrent build (e.g. the approval signal's background encode) may have inserted the row meanwhile
+        PaperEmbedding.objects.bulk_create(
+            to_create,
+            batch_size=WRITE_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['paper', 'model_version'],
+            update_fields=['vector', 'dim', 'content_hash'],
+        )
+        PaperEmbedding.objects.bulk_update(
+            to_update, ['vector', 'dim', 'content_hash'], batch_size=WRITE_BATCH_SIZE
+        )
+        if live:
+            stale_ids = [paper_id for paper_id, _, _ in stale]
+            profiles.invalidate_for_papers(stale_ids)
+            ann_index.update_index(stale_ids, embeddings, save=False, model_version=model_version)
+        return len(stale), len(to_create)
+
+    def get_user_profile_vector(self, user):
+        return profiles.get_profile_vector(user.id)
 
-        paper_embeds = PaperEmbedding.objects.select_related('paper')
-        vectors = np.array([pe.embedding for pe in paper_embeds])
-        similarities = cosine_similarity([user_vec], vectors)[0]
+    def content_scores(self, user, top_k=10, user_vec=None):
+        """Content-based ``[(paper_id, score), ...]``; popularity priors for users without a profile."""
+        if user_vec is None:
+            user_vec = self.get_user_profile_vector(user)
         exclude_ids = set(
             Rating.objects.filter(user=user).values_list('paper_id', flat=True)
         ) | set(
             Bookmark.objects.filter(user=user).values_list('paper_id', flat=True)
         )
-        scored = [
-            (pe.paper, sim) for pe, sim in zip(paper_embeds, similarities)
-            if pe.paper.id not in exclude_ids
-        ]
-        scored.sort(key=lambda tup: tup[1], reverse=True)
-        return scored[:top_k]
-
-    def collaborative_filter(self, user, top_k=10):
+        if user_vec is None:
+            scored = priors.cold_start_scores(user.id, top_k, exclude_ids=exclude_ids)
+            if scored:
+                return scored
+            # priors not built yet (a background build has been queued)
+            return list(
+                Paper.objects.filter(is_approved=True).exclude(id__in=exclude_ids).order_by(
+                    '-view_count'
+                ).values_list('id', 'view_count')[:top_k]
+            )
+
+        scored = ann_index.query(user_vec, top_k, exclude_ids)
+        if scored is None:
+            scored = get_embedding_matrix().top_k(user_vec, top_k, exclude_ids)
+        return scored
+
+    def content_based_recommend(self, user, top_k=10, user_vec=None):
+        return self._with_papers(self.content_scores(user, top_k, user_vec))
+
+    def collaborative_scores(self, user, top_k=10, mode=None):
+        """
+        Papers liked by similar researchers, as ``[(paper_id, score), ...]``.
+
+        ``mode='matrix'`` (the default, see ``ML_CF_MODE``) scores the user
+        against the cached item-item neighbour matrix; ``mode='counts'`` uses
+        the original per-user co-rater count queries.
+        """
+        mode = mode or getattr(settings, 'ML_CF_MODE', 'matrix')
+        if mode == 'matrix':
+            return collaborative.get_model().recommend(user.id, top_k)
+
         my_rated = list(
             Rating.objects.filter(user=user, rating__gte=4).values_list('paper_id', flat=True)
         )
@@ -66,14 +266,23 @@ class ImprovedRecommendationEngine:
         recs = Rating.objects.filter(
             user_id__in=similar_users, rating__gte=4
         ).exclude(paper_id__in=my_rated).values('paper_id').annotate(score=Count('id'))
-        rec_rows = list(recs.order_by('-score')[:top_k])
-        papers_map = Paper.objects.in_bulk([row['paper_id'] for row in rec_rows])
-        result = [
-            (papers_map[row['paper_id']], row['score'])
-            for row in rec_rows
-            if row['paper_id'] in papers_map
-        ]
-        return result
+        return [(row['paper_id'], row['score']) for row in recs.order_by('-score')[:top_k]]
+
+    def collaborative_filter(self, user, top_k=10, mode=None):
+        return self._with_papers(self.collaborative_scores(user, top_k, mode))
+
+    def _with_papers(self, scored):
+        papers_map = Paper.objects.in_bulk([pid for pid, _ in scored])
+        return [(papers_map[pid], score) for pid, score in scored if pid in papers_map]
+
+    def popularity_scores(self, paper_ids):
+        """``{paper_id: 0.7 * citations + 0.3 * downloads}`` from a single annotated query."""
+        return {
+            pid: cited * 0.7 + downloads * 0.3
+            for pid, cited, downloads in Paper.objects.filter(id__in=paper_ids).annotate(
+                n_cited=Count('cited_by')
+            ).values_list('id', 'n_cited', 'download_count')
+        }
 
     def normalize_scores(self, scores):
         if not scores:
@@ -83,69 +292,99 @@ class ImprovedRecommendationEngine:
         denom = max_s - min_s if max_s != min_s else 1e-8
         return {k: (v - min_s) / denom for k, v in scores.items()}
 
-    def hybrid_recommend(self, user, top_k=10, alpha=0.6, beta=0.3, gamma=0.1):
-        has_profile = self.get_user_profile_vector(user) is not None
-        content = self.content_based_recommend(user, top_k * 2)
-        collaborative = self.collaborative_filter(user, top_k * 2)
-
-        content_ids = {paper.id for paper, _ in content}
-        collab_ids = {paper.id for paper, _ in collaborative}
-
-        popularity = {}
-        for paper, _ in content:
-            score = (paper.citation_count * 0.7 if hasattr(paper, 'citation_count') else 0) + \
-                    (paper.download_count * 0.3 if hasattr(paper, 'download_count') else 0)
-            popularity[paper.id] = score
-
-        scores = {}
-        for paper, score in content:
-            scores[paper.id] = scores.get(paper.id, 0) + alpha * score
-        for paper, score in collaborative:
-            scores[paper.id] = scores.get(paper.id, 0) + beta * score
-        for pid, pop_score in popularity.items():
-            scores[pid] = scores.get(pid, 0) + gamma * pop_score
-
-        scores = self.normalize_scores(scores)
-        papers = Paper.objects.in_bulk(scores.keys())
-        ranked_raw = sorted(
-            ((papers[pid], score) for pid, score in scores.items()),
-            key=lambda x: x[1],
-            reverse=True
-        )[:top_k]
+    def hybrid_recommend(self, user, top_k=10, alpha=None, beta=None, gamma=None):
+        """
+        Blend content, collaborative and popularity signals for *user*.
+
+        The weights default to ``settings.ML_HYBRID_WEIGHTS`` and can be
+        overridden per call. Returns ``[(paper, score, reason), ...]``.
+        """
+        alpha, beta, gamma = self.weights(alpha, beta, gamma)
+        user_vec = self.get_user_profile_vector(user)
+        content = self.content_scores(user, top_k * 2, user_vec=user_vec)
+        collab = self.collaborative_scores(user, top_k * 2)
+        popularity = self.popularity_scores([pid for pid, _ in content])
+
+        ranked = self.combine_scores(
+            content, collab, popularity, user_vec is not None, top_k, alpha, beta, gamma,
+        )
+        papers = Paper.objects.in_bulk([pid for pid, _, _ in ranked])
+        return [(papers[pid], score, reason) for pid, score, reason in ranked if pid in papers]
+
+    @staticmethod
+    def weights(alpha=None, beta=None, gamma=None):
+        """Resolve (alpha, beta, gamma), falling back to ``settings.ML_HYBRID_WEIGHTS``."""
+        defaults = getattr(settings, 'ML_HYBRID_WEIGHTS', (0.6, 0.3, 0.1))
+        return tuple(
+            float(value) if value is not None else default
+            for value, default in zip((alpha, beta, gamma), defaults)
+        )
+
+    def combine_scores(self, content, collaborative, popularity, has_profile,
+                       top_k=10, alpha=0.6, beta=0.3, gamma=0.1):
+        """
+        Blend content, collaborative and popularity scores.
+
+        *content* and *collaborative* are ``[(paper_id, score), ...]`` lists and
+        *popularity* maps paper ids to a popularity score. The weighted sum is
+        min-max normalised over all candidates. Returns the top *k* as
+        ``[(paper_id, score, reason), ...]``.
+        """
+        candidates = list(dict.fromkeys(
+            [pid for pid, _ in content] + [pid for pid, _ in collaborative] + list(popularity)
+        ))
+        if not candidates:
+            return []
+        position = {pid: i for i, pid in enumerate(candidates)}
+
+        def as_array(pairs):
+            values = np.zeros(len(candidates))
+            if pairs:
+                idx = np.fromiter((position[pid] for pid, _ in pairs), dtype=np.int64, count=len(pairs))
+                np.add.at(values, idx, np.fromiter((s for _, s in pairs), dtype=np.float64, count=len(pairs)))
+            return values
+
+        content_arr = as_array(content)
+        collab_arr = as_array(collaborative)
+        popularity_arr = as_array(list(popularity.items()))
+        in_content = np.zeros(len(candidates), dtype=bool)
+        in_content[[position[pid] for pid, _ in content]] = True
+        in_collab = np.zeros(len(candidates), dtype=bool)
+        in_collab[[position[pid] for pid, _ in collaborative]] = True
+
+        combined = alpha * content_arr + beta * collab_arr + gamma * popularity_arr
+        spread = combined.max() - combined.min()
+        normalised = (combined - combined.min()) / (spread if spread else 1e-8)
+        top = np.argsort(-normalised, kind='stable')[:top_k]
 
         # Attach a human-readable reason per paper
         result = []
-        for paper, score in ranked_raw:
-            in_content = paper.id in content_ids
-            in_collab = paper.id in collab_ids
+        for i in top:
             if not has_profile:
                 reason = "Trending paper in the research community"
-            elif in_content and in_collab:
+            elif in_content[i] and in_collab[i]:
                 reason = "Matches your interests and is popular among researchers like you"
-            elif in_content:
+            elif in_content[i]:
                 reason = "Similar to papers you have rated or bookmarked"
-            elif in_collab:
+            elif in_collab[i]:
                 reason = "Highly rated by researchers with similar interests"
             else:
                 reason = "Trending in your research area"
-            result.append((paper, score, reason))
+            result.append((candidates[i], float(normalised[i]), reason))
         return result
 
     def save_recommendations(self, user, ranked_papers):
-        UserRecommendation.objects.filter(user=user).delete()
+        rows = []
         for item in ranked_papers:
             paper, score = item[0], item[1]
             reason = item[2] if len(item) == 3 else "Recommended based on your research activity"
-            UserRecommendation.objects.create(
-                user=user,
-                paper=paper,
-                score=score,
-                reason=reason,
-            )
+            rows.append((paper.id, float(score), reason))
+        return write_recommendations({user.id: rows})
 
-    def generate_for_user(self, user, top_k=10, rebuild_embeddings=False):
+    def generate_for_user(self, user, top_k=10, rebuild_embeddings=False,
+                          alpha=None, beta=None, gamma=None):
         if rebuild_embeddings:
             self.build_embeddings()
-        ranked = self.hybrid_recommend(user, top_k=top_k)
+        ranked = self.hybrid_recommend(user, top_k=top_k, alpha=alpha, beta=beta, gamma=gamma)
         self.save_recommendations(user, ranked)
         return ranked
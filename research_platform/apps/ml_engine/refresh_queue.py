@@ -0,0 +1,127 @@
+"""
+Debounced, coalescing queue for per-user recommendation refreshes.
+
+Ratings and bookmarks arrive in bursts; refreshing after every single one
+recomputes the same recommendations many times over. ``schedule(user_id)``
+instead waits ``settings.ML_REFRESH_DEBOUNCE_SECONDS`` after the first
+request, folds every further request for that user into the same job, and
+then hands one job to the shared background executor. A request that
+arrives while the user's job is running queues a single follow-up run;
+anything beyond that is dropped as a duplicate.
+"""
+import heapq
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DebouncedRefreshQueue:
+    def __init__(self, handler, window=None, executor=None):
+        self.handler = handler
+        self._window = window
+        self._executor = executor
+        self._due = {}       # user_id -> monotonic deadline
+        self._heap = []      # (deadline, user_id), may hold superseded entries
+        self._in_flight = set()
+        self._rerun = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self.counters = {'requested': 0, 'coalesced': 0, 'dropped': 0, 'executed': 0, 'failed': 0}
+
+    @property
+    def window(self):
+        if self._window is not None:
+            return self._window
+        return getattr(settings, 'ML_REFRESH_DEBOUNCE_SECONDS', 10)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            from apps.papers.background import executor
+            self._executor = executor
+        return self._executor
+
+    def schedule(self, user_id, delay=None):
+        """Request a refresh for *user_id* within *delay* seconds (default: the window)."""
+        delay = self.window if delay is None else delay
+        with self._cond:
+            self.counters['requested'] += 1
+            if user_id in self._in_flight:
+                if user_id in self._rerun:
+                    self.counters['dropped'] += 1
+                else:
+                    self._rerun.add(user_id)
+                return
+            deadline = time.monotonic() + delay
+            current = self._due.get(user_id)
+            if current is not None:
+                self.counters['coalesced'] += 1
+                if deadline >= current:
+                    return
+            self._push(user_id, deadline)
+            self._ensure_thread()
+
+    def _push(self, user_id, deadline):
+        self._due[user_id] = deadline
+        heapq.heappush(self._heap, (deadline, user_id))
+        self._cond.notify()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._dispatch_loop, name='recommendation-refresh-queue', daemon=True
+            )
+            self._thread.start()
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                deadline, user_id = self._heap[0]
+                wait = deadline - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+                if self._due.get(user_id) != deadline:
+                    continue  # superseded by an earlier deadline
+                del self._due[user_id]
+                self._in_flight.add(user_id)
+            self.executor.submit(self._run, user_id)
+
+    def _run(self, user_id):
+        try:
+            self.handler(user_id)
+        except Exception as exc:
+            logger.error("Recommendation refresh failed for user %s: %s", user_id, exc)
+            with self._cond:
+                self.counters['failed'] += 1
+        finally:
+            with self._cond:
+                self.counters['executed'] += 1
+                self._in_flight.discard(user_id)
+                if user_id in self._rerun:
+                    self._rerun.discard(user_id)
+                    self._push(user_id, time.monotonic() + self.window)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'depth': len(self._due),
+                'in_flight': len(self._in_flight),
+                'window_seconds': self.window,
+                **self.counters,
+            }
+
+
+def _refresh(user_id):
+    from .tasks import generate_recommendations
+    generate_recommendations(user_id)
+
+
+refresh_queue = DebouncedRefreshQueue(_refresh)
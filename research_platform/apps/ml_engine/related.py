@@ -0,0 +1,163 @@
+"""
+Precomputed related-paper neighbours.
+
+``build_related`` finds the top-K most similar papers for every embedded
+paper by multiplying the normalised embedding matrix against itself one block
+of rows at a time, so peak memory is ``block_size x n_papers`` scores. The
+neighbours are stored as ``RelatedPaper`` rows with ``relation_type='similar'``
+and the related-papers panel becomes a single indexed read.
+
+``update_for_papers`` handles newly approved or re-encoded papers: it computes
+their own neighbours and recomputes any nearby paper whose stored top-K the
+new papers would enter. Rows with other relation types (cites, same author,
+...) are never deleted; they only get their ``similarity_score`` refreshed.
+"""
+import logging
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+
+from apps.papers.models import RelatedPaper
+from .embeddings import get_embedding_matrix
+from .versions import active_embeddings
+
+logger = logging.getLogger(__name__)
+
+RELATION_TYPE = 'similar'
+BLOCK_SIZE = 1024
+WRITE_BATCH_SIZE = 1000
+CANDIDATE_FACTOR = 4  # nearest papers per new paper checked for a stale top-K, as a multiple of k
+
+
+def _top_k():
+    return getattr(settings, 'ML_RELATED_PAPERS', 10)
+
+
+def neighbours(matrix, rows, k):
+    """
+    Top-*k* neighbours of the given matrix rows.
+
+    Returns ``{paper_id: [(related_id, score), ...]}`` sorted by descending score.
+    """
+    k = min(k, len(matrix) - 1)
+    if k <= 0 or not len(rows):
+        return {}
+    queries = matrix.dense(rows, exact=bool(matrix.rerank))
+    scores = matrix.dot(queries)
+    scores[np.arange(len(rows)), rows] = -np.inf  # a paper is not related to itself
+    top, top_scores = matrix.select(queries, scores, k)
+    related_ids = matrix.paper_ids[top]
+    return {
+        int(matrix.paper_ids[row]): list(zip(related_ids[i].tolist(), top_scores[i].tolist()))
+        for i, row in enumerate(rows)
+    }
+
+
+def write_related(neighbours_by_paper):
+    """
+    Upsert the ``similar`` rows of the given papers and drop ones no longer in their top-K.
+
+    Returns the number of rows written.
+    """
+    rows = [
+        RelatedPaper(
+            paper_id=paper_id, related_to_id=related_id,
+            similarity_score=score, relation_type=RELATION_TYPE,
+        )
+        for paper_id, related in neighbours_by_paper.items()
+        for related_id, score in related
+    ]
+    keep = {(row.paper_id, row.related_to_id) for row in rows}
+    with transaction.atomic():
+        stale = [
+            row_id
+            for row_id, paper_id, related_id in RelatedPaper.objects.filter(
+                paper_id__in=list(neighbours_by_paper), relation_type=RELATION_TYPE
+            ).values_list('id', 'paper_id', 'related_to_id')
+            if (paper_id, related_id) not in keep
+        ]
+        if stale:
+            RelatedPaper.objects.filter(id__in=stale).delete()
+        RelatedPaper.objects.bulk_create(
+            rows,
+            batch_size=WRITE_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['paper', 'related_to'],
+            update_fields=['similarity_score'],
+        )
+    return len(rows)
+
+
+def build_related(k=None, block_size=BLOCK_SIZE):
+    """Recompute the related papers of every embedded paper; returns the number of papers processed."""
+    k = k or _top_k()
+    started = time.perf_counter()
+    matrix = get_embedding_matrix()
+    for start in range(0, len(matrix), block_size):
+        rows = np.arange(start, min(start + block_size, len(matrix)))
+        write_related(neighbours(matrix, rows, k))
+    # papers that lost their embedding keep no stale 'similar' rows
+    RelatedPaper.objects.filter(relation_type=RELATION_TYPE).exclude(
+        paper_id__in=active_embeddings().values('paper_id')
+    ).delete()
+    logger.info(
+        "Built related papers for %d papers (k=%d) in %.2fs",
+        len(matrix), k, time.perf_counter() - started,
+    )
+    return len(matrix)
+
+
+def update_for_papers(paper_ids, k=None, block_size=BLOCK_SIZE):
+    """
+    Refresh related papers after *paper_ids* were embedded.
+
+    Besides the papers themselves, any paper that already lists one of them
+    is recomputed, and so is any of the ``CANDIDATE_FACTOR * k`` papers
+    nearest to a new one whose stored neighbour list is short or whose
+    weakest neighbour scores below its similarity to that new paper. Returns
+    the number of papers rewritten.
+    """
+    k = k or _top_k()
+    matrix = get_embedding_matrix()
+    new_rows = matrix.rows(paper_ids)
+    if not len(new_rows):
+        return 0
+
+    # only the papers nearest to a new one can have it enter their top-K
+    similarity = matrix.dot(matrix.dense(new_rows, exact=bool(matrix.rerank)))
+    n_candidates = min(k * CANDIDATE_FACTOR, len(matrix))
+    candidates = np.setdiff1d(
+        np.argpartition(-similarity, n_candidates - 1, axis=1)[:, :n_candidates], new_rows
+    )
+    best = similarity[:, candidates].max(axis=0)
+    candidate_ids = matrix.paper_ids[candidates].tolist()
+    stored = {}
+    for start in range(0, len(candidate_ids), WRITE_BATCH_SIZE):
+        stored.update(
+            (row['paper_id'], (row['n'], row['weakest']))
+            for row in RelatedPaper.objects.filter(
+                relation_type=RELATION_TYPE, paper_id__in=candidate_ids[start:start + WRITE_BATCH_SIZE]
+            ).values('paper_id').annotate(n=Count('id'), weakest=Min('similarity_score'))
+        )
+    # candidates with no stored neighbours yet are always recomputed
+    weakest = np.full(len(candidates), -np.inf, dtype=np.float32)
+    for i, paper_id in enumerate(candidate_ids):
+        count, score = stored.get(paper_id, (0, None))
+        if count >= min(k, len(matrix) - 1):
+            weakest[i] = score
+    listing = matrix.rows(
+        RelatedPaper.objects.filter(
+            related_to_id__in=paper_ids, relation_type=RELATION_TYPE
+        ).values_list('paper_id', flat=True)
+    )
+    affected = np.union1d(np.union1d(new_rows, listing), candidates[best > weakest])
+
+    for start in range(0, len(affected), block_size):
+        write_related(neighbours(matrix, affected[start:start + block_size], k))
+    logger.info(
+        "Updated related papers for %d new papers (%d papers rewritten)", len(new_rows), len(affected)
+    )
+    return len(affected)
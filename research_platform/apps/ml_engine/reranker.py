@@ -0,0 +1,134 @@
+"""
+Cross-encoder re-ranking of retrieved RAG chunks.
+
+The retriever over-fetches ``settings.ML_RAG_RERANK_CANDIDATES`` chunks; a
+small cross-encoder scores each (query, chunk) pair on the CPU in batches of
+``ML_RAG_RERANK_BATCH_SIZE``, and the best chunks are kept until either
+``ML_RAG_CONTEXT_CHUNKS`` chunks or ``ML_RAG_CONTEXT_TOKEN_BUDGET`` tokens
+are reached.
+
+Batches are sized so that scoring finishes within ``ML_RAG_RERANK_DEADLINE_MS``,
+from a running estimate of the model's time per pair (the first request
+probes with a small batch). Chunks that were not scored by the deadline keep
+their retrieval order after the scored ones, as all chunks do while the model
+is still loading in the background; the token budget applies either way.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from .model_registry import cross_encoder_loaded, default_cross_encoder_name, get_cross_encoder
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4  # rough English average; avoids loading the LLM's tokenizer
+PROBE_BATCH_SIZE = 4  # first batch under a deadline, before the model's speed is known
+SPEED_SMOOTHING = 0.3  # weight of the newest batch in the per-pair time estimate
+
+_loading = set()
+_seconds_per_pair = {}  # model name -> moving average of predict time per (query, chunk) pair
+_loading_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _within_budget(docs, top_k, token_budget):
+    """The first *top_k* docs that fit in *token_budget* together; the best doc is always kept."""
+    kept, used = [], 0
+    for doc in docs:
+        tokens = estimate_tokens(doc["content"])
+        if kept and used + tokens > token_budget:
+            continue
+        kept.append(doc)
+        used += tokens
+        if len(kept) == top_k:
+            break
+    return kept
+
+
+def _load_in_background(name):
+    with _loading_lock:
+        if name in _loading:
+            return
+        _loading.add(name)
+
+    def load():
+        try:
+            get_cross_encoder(name)
+        except Exception as exc:
+            logger.error("Could not load re-rank model %s: %s", name, exc)
+        finally:
+            with _loading_lock:
+                _loading.discard(name)
+
+    threading.Thread(target=load, name='rag-rerank-load', daemon=True).start()
+
+
+def _model(name, deadline_ms):
+    """The cross-encoder, or None while it loads (never blocks a request that has a deadline)."""
+    if deadline_ms <= 0 or cross_encoder_loaded(name):
+        return get_cross_encoder(name)
+    _load_in_background(name)
+    return None
+
+
+def _batch_size(name, batch_size, deadline):
+    """Pairs that can still be scored before *deadline*, at most *batch_size*."""
+    if deadline is None:
+        return batch_size
+    per_pair = _seconds_per_pair.get(name)
+    if per_pair is None:
+        return min(batch_size, PROBE_BATCH_SIZE)
+    return min(batch_size, int((deadline - time.monotonic()) / per_pair))
+
+
+def _score(model, query, docs, batch_size, deadline, name=None):
+    """Cross-encoder scores for the leading docs that can be scored before *deadline* (maybe all, maybe none)."""
+    scores = []
+    while len(scores) < len(docs):
+        size = _batch_size(name, batch_size, deadline)
+        if size <= 0 or (deadline is not None and time.monotonic() >= deadline):
+            break
+        pairs = [(query, doc["content"]) for doc in docs[len(scores):len(scores) + size]]
+        started = time.monotonic()
+        scores.extend(float(score) for score in model.predict(pairs, batch_size=batch_size))
+        per_pair = (time.monotonic() - started) / len(pairs)
+        previous = _seconds_per_pair.get(name)
+        _seconds_per_pair[name] = per_pair if previous is None else (
+            SPEED_SMOOTHING * per_pair + (1 - SPEED_SMOOTHING) * previous
+        )
+    return scores
+
+
+def rerank(query, docs, top_k=None, token_budget=None, deadline_ms=None, batch_size=None, model_name=None):
+    """Best *top_k* of *docs* by cross-encoder score, within *token_budget* estimated tokens."""
+    top_k = top_k or getattr(settings, 'ML_RAG_CONTEXT_CHUNKS', 5)
+    token_budget = token_budget or getattr(settings, 'ML_RAG_CONTEXT_TOKEN_BUDGET', 2000)
+    if deadline_ms is None:
+        deadline_ms = getattr(settings, 'ML_RAG_RERANK_DEADLINE_MS', 300)
+    batch_size = batch_size or getattr(settings, 'ML_RAG_RERANK_BATCH_SIZE', 16)
+    model_name = model_name or default_cross_encoder_name()
+    if len(docs) < 2:
+        return _within_budget(docs, top_k, token_budget)
+
+    started = time.monotonic()
+    deadline = started + deadline_ms / 1000 if deadline_ms > 0 else None
+    scores = []
+    try:
+        model = _model(model_name, deadline_ms)
+        if model is not None:
+            scores = _score(model, query, docs, batch_size, deadline, model_name)
+    except Exception as exc:
+        logger.error("Re-ranking failed: %s", exc)
+
+    if len(scores) < len(docs):
+        logger.info(
+            "Re-ranked %d of %d chunks in %.0fms; the rest keep retrieval order.",
+            len(scores), len(docs), (time.monotonic() - started) * 1000,
+        )
+    order = sorted(range(len(scores)), key=lambda i: -scores[i]) + list(range(len(scores), len(docs)))
+    return _within_budget([docs[i] for i in order], top_k, token_budget)
@@ -1,15 +1,17 @@
 import logging
+from . import related
 from .recommendation_engine import ImprovedRecommendationEngine
 
 logger = logging.getLogger(__name__)
 
 
 def process_paper_upload(paper_id):
-    """Rebuild ML embeddings for all approved papers after a new paper is approved."""
+    """Encode the embedding for a newly approved paper and refresh its related papers."""
     try:
         engine = ImprovedRecommendationEngine()
-        engine.build_embeddings()
-        logger.info(f"Rebuilt embeddings after paper {paper_id} was approved")
+        if engine.build_embeddings(paper_ids=[paper_id]):
+            related.update_for_papers([paper_id])
+        logger.info(f"Built embedding for paper {paper_id} after approval")
         return {"status": "success", "paper_id": paper_id}
     except Exception as e:
         logger.error(f"Error building embeddings for paper {paper_id}: {str(e)}")
@@ -22,12 +24,12 @@ def generate_recommendations(user_id):
     """
     try:
         from apps.accounts.models import User
-        from apps.ml_engine.models import PaperEmbedding
+        from apps.ml_engine.versions import active_embeddings
         user = User.objects.get(id=user_id)
         engine = ImprovedRecommendationEngine()
 
         # Bootstrap embeddings on first run if the table is empty
-        if not PaperEmbedding.objects.exists():
+        if not active_embeddings().exists():
             logger.info("No embeddings found — running initial build before generating recommendations")
             engine.build_embeddings()
 
@@ -2,15 +2,56 @@
 ChromaDB vector store for research paper RAG.
 
 Papers are indexed when approved. Each paper is chunked into ~400-word
-segments and embedded with sentence-transformers all-MiniLM-L6-v2.
+segments and embedded with sentence-transformers all-MiniLM-L6-v2 through the
+encoder shared with the recommendation engine (see encoders.get_encoder), so
+chunk embedding uses the encoder process pool when ML_ENCODER_WORKERS > 1.
+
+``index_papers`` indexes many papers at once. Chunk ids are derived from
+the paper id and the chunk's content hash, and ``VectorIndexState`` keeps
+what was indexed for each paper, so unchanged papers are skipped and an
+edited paper only re-embeds the chunks whose text changed. New chunks are
+written with a few large ``upsert`` calls. Approvals go through
+``schedule_index``, which folds concurrent approvals into the same bulk call.
+
+``search_papers`` fuses dense results with a BM25 index over the same
+chunks (see lexical_index), keeps an LRU of query embeddings per process and
+caches results briefly in Django's cache under the current index generation, a
+database counter that ``index_papers`` and ``remove_paper`` bump whenever
+chunks change, so every process stops serving stale results within
+``ML_EMBEDDINGS_VERSION_CHECK_SECONDS``.
 """
+import hashlib
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from . import lexical_index
 
 logger = logging.getLogger(__name__)
 
+UPSERT_BATCH_SIZE = 5000
+LOAD_BATCH_SIZE = 1000  # papers and index states read from the database at a time
+CHUNK_SIZE = 400
+CHUNK_OVERLAP = 50
+GENERATION_PK = 1
+RESULT_CACHE_PREFIX = "ml_engine:rag_search:"
+SEARCH_MODES = ("dense", "lexical", "hybrid")
+# bump when _chunk_text or _paper_text change, so every paper is re-chunked
+CHUNKER_VERSION = f"words-{CHUNK_SIZE}-{CHUNK_OVERLAP}-v1"
+
 _client = None
 _collection = None
 
+_query_embeddings = OrderedDict()  # (model name, normalised query) -> embedding
+_query_cache_lock = threading.Lock()
+_generation = None  # (index generation counter, monotonic time it was read)
+
+_pending = set()
+_pending_lock = threading.Lock()
+_draining = False
+
 
 def get_collection():
     """Return (or lazily initialise) the ChromaDB collection."""
@@ -20,14 +61,12 @@ def get_collection():
 
     try:
         import chromadb
-        from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
         from django.conf import settings
+        from .model_registry import SharedEmbeddingFunction
 
         db_path = str(settings.BASE_DIR / 'chroma_db')
         _client = chromadb.PersistentClient(path=db_path)
-        embedding_fn = SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
+        embedding_fn = SharedEmbeddingFunction()
         _collection = _client.get_or_create_collection(
             name="research_papers",
             embedding_function=embedding_fn,
@@ -55,7 +94,7 @@ def _extract_pdf_text(pdf_path: str) -> str:
         return ""
 
 
-def _chunk_text(text: str, chunk_size: int = 400, overlap: int = 50):
+def _chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
     words = text.split()
     step = max(chunk_size - overlap, 1)
     chunks = []
@@ -66,23 +105,7 @@ def _chunk_text(text: str, chunk_size: int = 400, overlap: int = 50):
     return chunks
 
 
-def index_paper(paper_id: int) -> None:
-    """
-    Index an approved paper into ChromaDB.
-    Called from a background thread after paper approval.
-    """
-    collection = get_collection()
-    if collection is None:
-        return
-
-    from apps.papers.models import Paper
-
-    try:
-        paper = Paper.objects.get(pk=paper_id, is_approved=True)
-    except Paper.DoesNotExist:
-        logger.warning("Paper %s not found or not approved; skipping indexing.", paper_id)
-        return
-
+def _paper_text(paper, pdf_text: str = "") -> str:
     text_parts = []
     if paper.title:
         text_parts.append(f"Title: {paper.title}")
@@ -92,39 +115,298 @@ def index_paper(paper_id: int) -> None:
         text_parts.append(paper.abstract)
     if paper.summary:
         text_parts.append(paper.summary)
-    if paper.pdf_path:
+    if pdf_text:
+        text_parts.append(pdf_text)
+    return "\n\n".join(text_parts)
+
+
+def _pdf_file(paper):
+    if not paper.pdf_path:
+        return None
+    try:
+        return paper.pdf_path.path
+    except Exception as exc:
+        logger.warning("Could not read PDF for paper %s: %s", paper.id, exc)
+        return None
+
+
+def _extraction_pool(workers):
+    """Process pool for PDF parsing, which is CPU-bound; None extracts in the calling thread."""
+    if workers <= 1:
+        return None
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _extract_pdf_texts(paths, pool):
+    if pool is None or len(paths) < 2:
+        return [_extract_pdf_text(path) for path in paths]
+    return list(pool.map(_extract_pdf_text, paths))
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _chunk_id(paper_id: int, chunk: str) -> str:
+    """Stable id of a chunk: unchanged text keeps its id (and its embedding) across re-indexing."""
+    return f"paper_{paper_id}_{_sha256(chunk)[:24]}"
+
+
+def _source_fingerprint(paper, pdf_file) -> str:
+    """Hash of everything the indexed text is built from, computed without opening the PDF."""
+    parts = [paper.title or "", paper.authors or "", paper.abstract or "", paper.summary or ""]
+    if pdf_file:
         try:
-            pdf_text = _extract_pdf_text(paper.pdf_path.path)
-            if pdf_text:
-                text_parts.append(pdf_text)
-        except Exception as exc:
-            logger.warning("Could not read PDF for paper %s: %s", paper_id, exc)
+            stat = os.stat(pdf_file)
+            parts += [paper.pdf_path.name, str(stat.st_size), str(stat.st_mtime_ns)]
+        except OSError:
+            parts.append(paper.pdf_path.name)
+    return _sha256("\x1f".join(parts))
 
-    full_text = "\n\n".join(text_parts)
-    if not full_text.strip():
-        logger.warning("No indexable text for paper %s.", paper_id)
-        return
 
-    chunks = _chunk_text(full_text)
-    if not chunks:
-        return
+def _upsert_batch_size(collection, batch_size):
+    """Largest write the Chroma client accepts, capped at *batch_size*."""
+    try:
+        return min(batch_size, collection._client.get_max_batch_size())
+    except Exception:
+        return batch_size
 
-    # Remove stale chunks before re-indexing
-    _remove_chunks(collection, paper_id)
 
-    ids = [f"paper_{paper_id}_chunk_{i}" for i in range(len(chunks))]
-    metadatas = [
-        {
-            "paper_id": paper_id,
-            "title": paper.title or "",
-            "authors": paper.authors or "",
-            "chunk_index": i,
-        }
-        for i in range(len(chunks))
-    ]
+def _write_chunks(collection, ids, chunks, embeddings, metadatas, batch_size):
+    step = _upsert_batch_size(collection, batch_size)
+    for start in range(0, len(ids), step):
+        stop = start + step
+        collection.upsert(
+            ids=ids[start:stop],
+            documents=chunks[start:stop],
+            embeddings=embeddings[start:stop],
+            metadatas=metadatas[start:stop],
+        )
+
+
+def _update_metadata(collection, ids, metadatas, batch_size):
+    step = _upsert_batch_size(collection, batch_size)
+    for start in range(0, len(ids), step):
+        collection.update(ids=ids[start:start + step], metadatas=metadatas[start:start + step])
+
+
+def _delete_chunks(collection, ids, batch_size):
+    step = _upsert_batch_size(collection, batch_size)
+    for start in range(0, len(ids), step):
+        collection.delete(ids=ids[start:start + step])
+
+
+def index_papers(paper_ids, batch_size: int = None, workers: int = None, progress=None, encoder=None,
+                 full: bool = False) -> int:
+    """
+    Index approved papers into ChromaDB in bulk; returns the number of papers (re-)indexed.
+
+    Each paper's ``VectorIndexState`` records the fingerprint of its source
+    fields, the hash of its extracted text, the chunker version, the model
+    and the ids of its chunks. A paper whose fingerprint, chunker and model
+    are unchanged is skipped without touching the PDF; one whose text hash
+    still matches only has its fingerprint refreshed. Otherwise chunks are
+    keyed by content hash, so only new chunks are embedded and only
+    vanished ones are deleted. *full* ignores the stored state.
+
+    Papers and their states are loaded ``LOAD_BATCH_SIZE`` ids at a time and
+    processed *batch_size* at a time: PDF text is extracted by
+    *workers* processes and the new chunks of a batch are embedded in one
+    encoder call and written with a few ``upsert`` calls. *progress*, if
+    given, is called with ``(seen, indexed)`` after every batch. *encoder*
+    defaults to this process's shared encoder.
+    """
+    collection = get_collection()
+    if collection is None:
+        return 0
+
+    from django.conf import settings
+    from apps.papers.models import Paper
+    from .encoders import get_encoder
+    from .model_registry import default_model_name
+    from .models import VectorIndexState
+
+    batch_size = batch_size or getattr(settings, 'ML_VECTOR_INDEX_BATCH_SIZE', 64)
+    if workers is None:
+        workers = getattr(settings, 'ML_VECTOR_INDEX_WORKERS', 0) or os.cpu_count() or 1
+    model_name = encoder.model_name if encoder is not None else default_model_name()
 
-    collection.add(ids=ids, documents=chunks, metadatas=metadatas)
-    logger.info("Indexed paper %s (%d chunks).", paper_id, len(chunks))
+    paper_ids = sorted(set(paper_ids))
+    seen = indexed = 0
+    pool = None
+    try:
+        for start in range(0, len(paper_ids), LOAD_BATCH_SIZE):
+            papers = list(Paper.objects.filter(
+                pk__in=paper_ids[start:start + LOAD_BATCH_SIZE], is_approved=True
+            ).only('id', 'title', 'authors', 'abstract', 'summary', 'pdf_path').order_by('id'))
+            states = {} if full else {
+                state.paper_id: state
+                for state in VectorIndexState.objects.filter(paper__in=[paper.id for paper in papers])
+            }
+
+            pending = []
+            for paper in papers:
+                pdf_file = _pdf_file(paper)
+                fingerprint = _source_fingerprint(paper, pdf_file)
+                state = states.get(paper.id)
+                if (state is not None and state.source_fingerprint == fingerprint
+                        and state.chunker_version == CHUNKER_VERSION and state.model_name == model_name):
+                    continue
+                pending.append((paper, pdf_file, fingerprint))
+            if len(pending) < len(papers):
+                logger.debug("Vector store: %d of %d papers unchanged.", len(papers) - len(pending), len(papers))
+            seen += len(papers) - len(pending)
+            if not pending:
+                if progress is not None:
+                    progress(seen, indexed)
+                continue
+
+            encoder = encoder or get_encoder(model_name)
+            if pool is None and any(pdf_file for _, pdf_file, _ in pending):
+                pool = _extraction_pool(min(workers, len(paper_ids) - start))
+            seen, indexed = _index_batches(
+                collection, encoder, model_name, pending, states, batch_size, pool, progress, seen, indexed,
+            )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if indexed:
+        lexical_index.save_index()
+        bump_index_generation()
+    return indexed
+
+
+def _index_batches(collection, encoder, model_name, pending, states, batch_size, pool, progress, seen=0, indexed=0):
+    """Index *pending* papers *batch_size* at a time; returns the updated ``(seen, indexed)`` counts."""
+    from django.conf import settings
+    from .models import VectorIndexState
+
+    encode_batch_size = getattr(settings, 'ML_ENCODE_BATCH_SIZE', 256)
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        seen += len(batch)
+        files = [pdf_file for _, pdf_file, _ in batch]
+        extracted = iter(_extract_pdf_texts([path for path in files if path], pool))
+        pdf_texts = [next(extracted) if path else "" for path in files]
+
+        new_ids, new_chunks, new_metadatas = [], [], []
+        kept_ids, kept_metadatas, stale_ids, unindexed = [], [], [], []
+        new_states = []
+        for (paper, _, fingerprint), pdf_text in zip(batch, pdf_texts):
+            text = _paper_text(paper, pdf_text)
+            text_hash = _sha256(text)
+            state = states.get(paper.id)
+            current = state is not None and state.chunker_version == CHUNKER_VERSION \
+                and state.model_name == model_name
+            if current and state.text_hash == text_hash:
+                state.source_fingerprint = fingerprint
+                new_states.append(state)
+                continue
+
+            old_ids = set(state.chunk_ids) if current else set()
+            if state is None:
+                unindexed.append(paper.id)  # may still hold chunks written before states were kept
+            elif not current:
+                stale_ids.extend(state.chunk_ids)
+
+            chunk_ids = []
+            for i, chunk in enumerate(_chunk_text(text)):
+                chunk_id = _chunk_id(paper.id, chunk)
+                if chunk_id in chunk_ids:
+                    continue  # an identical chunk adds nothing to retrieval
+                chunk_ids.append(chunk_id)
+                metadata = {
+                    "paper_id": paper.id,
+                    "title": paper.title or "",
+                    "authors": paper.authors or "",
+                    "chunk_index": i,
+                }
+                if chunk_id in old_ids:
+                    kept_ids.append(chunk_id)
+                    kept_metadatas.append(metadata)
+                else:
+                    new_ids.append(chunk_id)
+                    new_chunks.append(chunk)
+                    new_metadatas.append(metadata)
+            if not chunk_ids:
+                logger.warning("No indexable text for paper %s.", paper.id)
+            if current:
+                stale_ids.extend(old_ids.difference(chunk_ids))
+            new_states.append(VectorIndexState(
+                paper_id=paper.id, source_fingerprint=fingerprint, text_hash=text_hash,
+                chunker_version=CHUNKER_VERSION, model_name=model_name, chunk_ids=chunk_ids,
+            ))
+            indexed += 1
+
+        if unindexed:
+            collection.delete(where={"paper_id": {"$in": unindexed}})
+        if stale_ids:
+            _delete_chunks(collection, stale_ids, UPSERT_BATCH_SIZE)
+        if kept_ids:
+            _update_metadata(collection, kept_ids, kept_metadatas, UPSERT_BATCH_SIZE)
+        if new_chunks:
+            embeddings = encoder.encode(new_chunks, batch_size=encode_batch_size)
+            _write_chunks(collection, new_ids, new_chunks, embeddings.tolist(), new_metadatas, UPSERT_BATCH_SIZE)
+        lexical_index.update_index(
+            new_ids, [metadata["paper_id"] for metadata in new_metadatas], new_chunks,
+            removed_ids=stale_ids, removed_papers=unindexed, save=False,
+        )
+        VectorIndexState.objects.bulk_create(
+            new_states,
+            update_conflicts=True,
+            unique_fields=['paper'],
+            update_fields=['source_fingerprint', 'text_hash', 'chunker_version', 'model_name', 'chunk_ids', 'updated_at'],
+        )
+        logger.info(
+            "Indexed %d papers: %d chunks embedded, %d kept, %d removed.",
+            indexed, len(new_chunks), len(kept_ids), len(stale_ids),
+        )
+        if progress is not None:
+            progress(seen, indexed)
+    return seen, indexed
+
+
+def index_paper(paper_id: int) -> None:
+    """
+    Index an approved paper into ChromaDB.
+    Called from a background thread after paper approval; returns at once if the paper is unchanged.
+    """
+    index_papers([paper_id], workers=1)
+
+
+def schedule_index(paper_ids) -> None:
+    """
+    Queue papers for indexing on the background executor.
+
+    Approvals that arrive while an indexing job is running are collected
+    and written by the next ``index_papers`` call, so a bulk approval costs
+    a handful of batched jobs rather than one job per paper.
+    """
+    global _draining
+    with _pending_lock:
+        _pending.update(paper_ids)
+        if _draining:
+            return
+        _draining = True
+    from apps.papers.background import executor
+    executor.submit(_drain_pending)
+
+
+def _drain_pending() -> None:
+    global _draining
+    while True:
+        with _pending_lock:
+            if not _pending:
+                _draining = False
+                return
+            paper_ids = sorted(_pending)
+            _pending.clear()
+        try:
+            index_papers(paper_ids)
+        except Exception as exc:
+            logger.error("Failed to index papers %s in vector store: %s", paper_ids, exc)
 
 
 def remove_paper(paper_id: int) -> None:
@@ -132,40 +414,170 @@ def remove_paper(paper_id: int) -> None:
     collection = get_collection()
     if collection is None:
         return
+    from .models import VectorIndexState
+
     _remove_chunks(collection, paper_id)
+    VectorIndexState.objects.filter(paper_id=paper_id).delete()
+    lexical_index.update_index(removed_papers=[paper_id])
+    bump_index_generation()
     logger.info("Removed paper %s from vector store.", paper_id)
 
 
 def _remove_chunks(collection, paper_id: int) -> None:
     try:
-        existing = collection.get(where={"paper_id": paper_id})
-        if existing["ids"]:
-            collection.delete(ids=existing["ids"])
+        collection.delete(where={"paper_id": paper_id})
     except Exception as exc:
         logger.warning("Could not remove existing chunks for paper %s: %s", paper_id, exc)
 
 
-def search_papers(query: str, n_results: int = 5) -> list:
+def index_generation() -> int:
     """
-    Semantic search over indexed paper chunks.
+    Counter bumped whenever indexed chunks change; part of every search result cache key.
+
+    Read from the database at most every ``ML_EMBEDDINGS_VERSION_CHECK_SECONDS``.
+    """
+    from django.conf import settings
+    from .models import VectorIndexGeneration
+
+    global _generation
+    now = time.monotonic()
+    cached = _generation
+    if cached is not None and now - cached[1] < getattr(settings, 'ML_EMBEDDINGS_VERSION_CHECK_SECONDS', 5):
+        return cached[0]
+    counter = VectorIndexGeneration.objects.filter(pk=GENERATION_PK).values_list('counter', flat=True).first() or 0
+    _generation = (counter, now)
+    return counter
+
+
+def bump_index_generation() -> None:
+    """Invalidate cached search results in every process."""
+    from django.db.models import F
+    from .models import VectorIndexGeneration
+
+    global _generation
+    if not VectorIndexGeneration.objects.filter(pk=GENERATION_PK).update(counter=F('counter') + 1):
+        _, created = VectorIndexGeneration.objects.get_or_create(pk=GENERATION_PK, defaults={'counter': 1})
+        if not created:
+            VectorIndexGeneration.objects.filter(pk=GENERATION_PK).update(counter=F('counter') + 1)
+    _generation = None  # this process re-reads it straight away
+
+
+def _normalise_query(query: str) -> str:
+    """Collapse whitespace, and fold case only if the embedding model lowercases its input anyway."""
+    from .model_registry import lowercases_input
+
+    text = " ".join(query.split())
+    return text.lower() if lowercases_input() else text
+
+
+def _query_embedding(text: str) -> list:
+    """Embedding of a normalised query, from this process's LRU cache when it was seen recently."""
+    from django.conf import settings
+    from .encoders import get_encoder
+    from .model_registry import default_model_name
+
+    key = (default_model_name(), text)
+    with _query_cache_lock:
+        embedding = _query_embeddings.get(key)
+        if embedding is not None:
+            _query_embeddings.move_to_end(key)
+            return embedding
+    embedding = get_encoder(key[0]).encode([text])[0].tolist()
+    with _query_cache_lock:
+        _query_embeddings[key] = embedding
+        while len(_query_embeddings) > getattr(settings, 'ML_RAG_QUERY_CACHE_SIZE', 1024):
+            _query_embeddings.popitem(last=False)
+    return embedding
+
+
+def _result_cache_key(text: str, n_results: int, mode: str, rrf_k: int) -> str:
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{RESULT_CACHE_PREFIX}{index_generation()}:{mode}:{rrf_k}:{n_results}:{digest}"
+
+
+def _dense_search(collection, text: str, n: int):
+    """Chunk ids ranked by embedding similarity, plus their ``{content, metadata}`` docs."""
+    results = collection.query(query_embeddings=[_query_embedding(text)], n_results=n)
+    ranked, docs = [], {}
+    if results["documents"] and results["documents"][0]:
+        for i, doc in enumerate(results["documents"][0]):
+            meta = results["metadatas"][0][i] if results["metadatas"] else {}
+            ranked.append(results["ids"][0][i])
+            docs[ranked[-1]] = {"content": doc, "metadata": meta}
+    return ranked, docs
+
+
+def _fuse(rankings, rrf_k: int):
+    """Reciprocal rank fusion: each ranking adds 1 / (rrf_k + rank) to a chunk's score."""
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def search_papers(query: str, n_results: int = 5, mode: str = None, rrf_k: int = None) -> list:
+    """
+    Search over indexed paper chunks.
     Returns a list of dicts: [{content, metadata}, ...]
+
+    *mode* is ``'dense'`` (embedding similarity), ``'lexical'`` (BM25, see
+    lexical_index) or ``'hybrid'``, which takes the top
+    ``settings.ML_RAG_FUSION_CANDIDATES`` chunks of each and merges them by
+    reciprocal rank fusion with constant *rrf_k*. Both default to settings;
+    without a lexical index every mode falls back to dense search.
+
+    Results are cached for ``settings.ML_RAG_RESULT_CACHE_TTL`` seconds per
+    normalised query, options and index generation, so a repeated question
+    skips the encoder and both indexes; re-indexing a paper moves to a new
+    generation and so never serves stale chunks.
     """
     collection = get_collection()
     if collection is None:
         return []
 
+    from django.conf import settings
+    from django.core.cache import cache
+
+    mode = mode or getattr(settings, 'ML_RAG_SEARCH_MODE', 'hybrid')
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {mode!r}; expected one of {', '.join(SEARCH_MODES)}")
+    rrf_k = rrf_k or getattr(settings, 'ML_RAG_RRF_K', 60)
+    text = _normalise_query(query)
+    key = _result_cache_key(text, n_results, mode, rrf_k)
+    docs = cache.get(key)
+    if docs is not None:
+        return docs
+
     try:
         total = collection.count()
         if total == 0:
             return []
-        n = min(n_results, total)
-        results = collection.query(query_texts=[query], n_results=n)
-        docs = []
-        if results["documents"] and results["documents"][0]:
-            for i, doc in enumerate(results["documents"][0]):
-                meta = results["metadatas"][0][i] if results["metadatas"] else {}
-                docs.append({"content": doc, "metadata": meta})
-        return docs
+        candidates = n_results
+        if mode == 'hybrid':
+            candidates = max(n_results, getattr(settings, 'ML_RAG_FUSION_CANDIDATES', 20))
+        lexical = lexical_index.search(text, candidates) if mode != 'dense' else None
+        if lexical is None:
+            mode = 'dense'
+
+        ranked, found = [], {}
+        if mode != 'lexical':
+            ranked, found = _dense_search(collection, text, min(candidates, total))
+        if mode == 'lexical':
+            ranked = [chunk_id for chunk_id, _ in lexical]
+        elif mode == 'hybrid':
+            ranked = _fuse([ranked, [chunk_id for chunk_id, _ in lexical]], rrf_k)
+        ranked = ranked[:n_results]
+
+        missing = [chunk_id for chunk_id in ranked if chunk_id not in found]
+        if missing:
+            fetched = collection.get(ids=missing, include=["documents", "metadatas"])
+            for chunk_id, doc, meta in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                found[chunk_id] = {"content": doc, "metadata": meta or {}}
+        # a chunk deleted since the lexical index was saved is simply skipped
+        docs = [found[chunk_id] for chunk_id in ranked if chunk_id in found]
     except Exception as exc:
         logger.error("Vector search failed: %s", exc)
         return []
+    cache.set(key, docs, getattr(settings, 'ML_RAG_RESULT_CACHE_TTL', 60))
+    return docs
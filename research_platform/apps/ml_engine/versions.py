@@ -0,0 +1,182 @@
+"""
+Versioned embedding sets.
+
+Every ``PaperEmbedding`` row belongs to the set named by its
+``model_version``. The ``RecommendationModel`` row with ``is_active=True``
+names the set that serves recommendations, and its ``model_path`` is the
+sentence-transformers model that encodes that set.
+
+Switching models does not interrupt traffic:
+
+1. ``register_version`` adds an inactive ``RecommendationModel`` row.
+2. ``backfill`` encodes every approved paper into the new set while the old
+   set keeps serving.
+3. ``activate`` flips ``is_active`` in one transaction and bumps the
+   embeddings version, so every process reloads its matrix and switches to
+   the new set's ANN index, which is built first if it is missing.
+4. ``cleanup`` deletes the rows and ANN indexes of the sets that are no
+   longer active.
+
+The ``switch_embedding_model`` management command runs all four steps.
+"""
+import logging
+import threading
+
+from django.db import transaction
+
+from . import ann_index
+from .embeddings import bump_version, current_version
+from .model_registry import default_model_name
+from .models import PaperEmbedding, RecommendationModel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VERSION = 'bert-mini-v1'
+DELETE_BATCH_SIZE = 5000
+
+_active = None  # (embeddings version counter, model_version, model name)
+_lock = threading.Lock()
+
+
+def _load_active():
+    row = RecommendationModel.objects.filter(is_active=True).order_by('-created_at').values_list(
+        'version', 'model_path'
+    ).first()
+    if row is None:
+        return DEFAULT_VERSION, default_model_name()
+    version, model_path = row
+    return version, model_path or default_model_name()
+
+
+def _active_set(fresh=False):
+    global _active
+    if fresh:
+        return _load_active()
+    counter = current_version()
+    if _active is not None and _active[0] == counter:
+        return _active[1:]
+    with _lock:
+        if _active is None or _active[0] != counter:
+            _active = (counter, *_load_active())
+    return _active[1:]
+
+
+def active_version(fresh=False) -> str:
+    """
+    ``model_version`` of the embedding set that serves traffic.
+
+    Reads are cached until the embeddings version counter moves; pass
+    *fresh* to read the ``RecommendationModel`` row directly, as writers do
+    so that they never target a set that has just been switched off.
+    """
+    return _active_set(fresh)[0]
+
+
+def active_model_name() -> str:
+    return _active_set()[1]
+
+
+def model_name_for(version) -> str:
+    """Sentence model that encodes *version*."""
+    model_path = RecommendationModel.objects.filter(version=version).values_list(
+        'model_path', flat=True
+    ).first()
+    return model_path or default_model_name()
+
+
+def active_embeddings():
+    """``PaperEmbedding`` rows of the active set."""
+    return PaperEmbedding.objects.filter(model_version=active_version())
+
+
+def register_version(version, model_name, name=None):
+    """Create the inactive ``RecommendationModel`` row for a new embedding set."""
+    row, created = RecommendationModel.objects.get_or_create(
+        version=version,
+        defaults={'name': name or model_name, 'model_path': model_name, 'is_active': False},
+    )
+    if created:
+        logger.info("Registered embedding set %s (%s)", version, model_name)
+    return row
+
+
+def coverage(version):
+    """``(embedded, approved)`` paper counts for *version*."""
+    from apps.papers.models import Paper
+
+    approved = Paper.objects.filter(is_approved=True)
+    embedded = PaperEmbedding.objects.filter(model_version=version, paper__in=approved).count()
+    return embedded, approved.count()
+
+
+def backfill(version, **options):
+    """Encode approved papers into *version* without touching the active set; returns the count."""
+    from .recommendation_engine import ImprovedRecommendationEngine
+
+    return ImprovedRecommendationEngine().build_embeddings(model_version=version, **options)
+
+
+def missing_papers(version):
+    """Ids of approved papers that have no embedding in *version*."""
+    from apps.papers.models import Paper
+
+    return list(
+        Paper.objects.filter(is_approved=True)
+        .exclude(id__in=PaperEmbedding.objects.filter(model_version=version).values('paper_id'))
+        .values_list('id', flat=True)
+    )
+
+
+def activate(version, require_complete=True, **backfill_options):
+    """
+    Make *version* the active embedding set.
+
+    Papers approved since the last back-fill pass are encoded first, once
+    before and once more inside the flip transaction, so the set is complete
+    at the moment it goes live. Refuses to flip to a set that still does not
+    cover every approved paper unless *require_complete* is False. Every
+    process picks the flip up through the embeddings version counter.
+
+    The ANN index is kept per set, so processes stop querying the old
+    set's index as soon as they see the flip; it is built for *version*
+    here unless it already was.
+    """
+    if not RecommendationModel.objects.filter(version=version).exists():
+        raise ValueError(f"Embedding set {version!r} is not registered")
+    backfill(version, **backfill_options)
+    with transaction.atomic():
+        rows = list(RecommendationModel.objects.select_for_update().all())
+        target = next(row for row in rows if row.version == version)
+        missing = missing_papers(version)
+        if missing:
+            backfill(version, paper_ids=missing, **backfill_options)
+        if require_complete:
+            embedded, approved = coverage(version)
+            if embedded < approved:
+                raise ValueError(
+                    f"Embedding set {version!r} covers {embedded} of {approved} approved papers"
+                )
+        RecommendationModel.objects.exclude(pk=target.pk).filter(is_active=True).update(is_active=False)
+        RecommendationModel.objects.filter(pk=target.pk).update(is_active=True)
+        bump_version()
+    logger.info("Activated embedding set %s", version)
+    if ann_index.configured_backend() and ann_index.get_index(version) is None:
+        ann_index.build_index(model_version=version)
+    return target
+
+
+def cleanup():
+    """Delete embeddings of every set other than the active one; returns the number of rows removed."""
+    version = active_version()
+    removed = 0
+    while True:
+        ids = list(
+            PaperEmbedding.objects.exclude(model_version=version).values_list('id', flat=True)[:DELETE_BATCH_SIZE]
+        )
+        if not ids:
+            break
+        removed += PaperEmbedding.objects.filter(id__in=ids).delete()[0]
+    if removed:
+        logger.info("Removed %d embeddings of inactive sets", removed)
+    ann_index.remove_indexes(keep=version)
+    return removed
@@ -1,15 +1,21 @@
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render
-from .recommendation_engine import ImprovedRecommendationEngine
-from .models import UserRecommendation
+from . import recommendation_cache
+from .refresh_queue import refresh_queue
+
 
 @login_required
 def generate_recommendations_for_user(request):
-    engine = ImprovedRecommendationEngine()
-    recs = engine.generate_for_user(request.user, top_k=10)
-    return render(request, "papers/recommendations.html", {"recommendations": recs})
+    """Queue an immediate refresh and show the current list; the new one replaces it when ready."""
+    refresh_queue.schedule(request.user.id, delay=0)
+    recs = recommendation_cache.get_recommendations(request.user.id)
+    return render(request, "papers/recommendations.html", {
+        "recommendations": recs,
+        "last_updated": recs[0]['created_at'] if recs else None,
+        "generating": not recs,
+    })
 
 @login_required
 def user_recommendations(request):
-    recs = UserRecommendation.objects.filter(user=request.user).select_related('paper').order_by('-score')[:10]
+    recs = recommendation_cache.get_recommendations(request.user.id)
     return render(request, "papers/recommendations.html", {"recommendations": recs})
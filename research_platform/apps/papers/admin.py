@@ -1,4 +1,5 @@
 from django.contrib import admin
+from .signals import process_vector_indexing
 from .models import (
     Paper, Category, Bookmark, Rating, Citation, ReadingProgress,
     PaperVersion, RelatedPaper, PaperAnnotation, ReadingList, ReadingListPaper,
@@ -14,7 +15,10 @@ class PaperAdmin(admin.ModelAdmin):
     actions = ['approve_papers', 'reject_papers']
     
     def approve_papers(self, request, queryset):
+        paper_ids = list(queryset.filter(is_approved=False).values_list('id', flat=True))
         queryset.update(is_approved=True)
+        # update() bypasses post_save, so index the newly approved papers in one batch
+        process_vector_indexing(paper_ids)
     approve_papers.short_description = "Approve selected papers"
     
     def reject_papers(self, request, queryset):
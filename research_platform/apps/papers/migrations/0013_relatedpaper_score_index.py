@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0012_paper_archive_fields'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='relatedpaper',
+            index=models.Index(fields=['paper', '-similarity_score'], name='related_paper_score_idx'),
+        ),
+    ]
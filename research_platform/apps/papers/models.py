@@ -129,6 +129,9 @@ class RelatedPaper(models.Model):
     class Meta:
         db_table = 'related_papers'
         unique_together = ['paper', 'related_to']
+        indexes = [
+            models.Index(fields=['paper', '-similarity_score'], name='related_paper_score_idx'),
+        ]
 
 
 class PaperAnnotation(models.Model):
@@ -1,6 +1,6 @@
 # apps/papers/signals.py
 import logging
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from .models import Paper, ReadingProgress, PaperView, Rating, Bookmark
 from .background import executor
@@ -18,12 +18,10 @@ def process_summary(paper_id, pdf_file):
         logger.error("Failed to generate summary for Paper %s: %s", paper_id, e)
 
 
-def process_vector_indexing(paper_id):
-    from apps.ml_engine.vector_store import index_paper
-    try:
-        index_paper(paper_id)
-    except Exception as e:
-        logger.error("Failed to index Paper %s in vector store: %s", paper_id, e)
+def process_vector_indexing(paper_ids):
+    """Queue papers for the vector store; approvals landing together are indexed in one bulk call."""
+    from apps.ml_engine.vector_store import schedule_index
+    schedule_index(paper_ids)
 
 
 @receiver(post_save, sender=Paper)
@@ -53,11 +51,9 @@ def process_ml_embedding(paper_id):
 
 
 def refresh_recommendations(user_id):
-    from apps.ml_engine.tasks import generate_recommendations
-    try:
-        generate_recommendations(user_id)
-    except Exception as e:
-        logger.error("Failed to refresh recommendations for user %s: %s", user_id, e)
+    """Queue a debounced recommendation refresh; bursts of activity coalesce into one job."""
+    from apps.ml_engine.refresh_queue import refresh_queue
+    refresh_queue.schedule(user_id)
 
 
 @receiver(post_save, sender=Paper)
@@ -66,7 +62,7 @@ def index_paper_on_approval(sender, instance, created, **kwargs):
     was_approved = getattr(instance, "_was_approved", False)
     just_approved = instance.is_approved and (created or not was_approved)
     if just_approved:
-        executor.submit(process_vector_indexing, instance.id)
+        process_vector_indexing([instance.id])
         executor.submit(process_ml_embedding, instance.id)
 
 
@@ -74,14 +70,67 @@ def index_paper_on_approval(sender, instance, created, **kwargs):
 def update_recommendations_on_rating(sender, instance, **kwargs):
     """Refresh recommendations when user rates a paper 4 or higher."""
     if instance.rating >= 4:
-        executor.submit(refresh_recommendations, instance.user_id)
+        refresh_recommendations(instance.user_id)
 
 
 @receiver(post_save, sender=Bookmark)
 def update_recommendations_on_bookmark(sender, instance, created, **kwargs):
     """Refresh recommendations when user bookmarks a paper."""
     if created:
-        executor.submit(refresh_recommendations, instance.user_id)
+        refresh_recommendations(instance.user_id)
+
+
+def sync_profile_vector(user_id, paper_id, liked):
+    """Add or remove a paper from the user's stored recommendation profile vector."""
+    from apps.ml_engine.profiles import paper_liked_changed
+    try:
+        paper_liked_changed(user_id, paper_id, liked)
+    except Exception as e:
+        logger.error("Failed to update profile vector for user %s: %s", user_id, e)
+
+
+@receiver(pre_save, sender=Rating)
+def capture_previous_rating(sender, instance, **kwargs):
+    """Store the previous rating so post_save can tell whether the paper became (un)liked."""
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = Rating.objects.filter(
+            pk=instance.pk
+        ).values_list('rating', flat=True).first()
+
+
+@receiver(post_save, sender=Rating)
+def update_profile_on_rating(sender, instance, **kwargs):
+    was_liked = (getattr(instance, '_previous_rating', None) or 0) >= 4
+    is_liked = instance.rating >= 4
+    if was_liked != is_liked and not Bookmark.objects.filter(
+        user_id=instance.user_id, paper_id=instance.paper_id
+    ).exists():
+        sync_profile_vector(instance.user_id, instance.paper_id, is_liked)
+
+
+@receiver(post_delete, sender=Rating)
+def update_profile_on_rating_delete(sender, instance, **kwargs):
+    if instance.rating >= 4 and not Bookmark.objects.filter(
+        user_id=instance.user_id, paper_id=instance.paper_id
+    ).exists():
+        sync_profile_vector(instance.user_id, instance.paper_id, False)
+
+
+@receiver(post_save, sender=Bookmark)
+def update_profile_on_bookmark(sender, instance, created, **kwargs):
+    if created and not Rating.objects.filter(
+        user_id=instance.user_id, paper_id=instance.paper_id, rating__gte=4
+    ).exists():
+        sync_profile_vector(instance.user_id, instance.paper_id, True)
+
+
+@receiver(post_delete, sender=Bookmark)
+def update_profile_on_bookmark_delete(sender, instance, **kwargs):
+    if not Rating.objects.filter(
+        user_id=instance.user_id, paper_id=instance.paper_id, rating__gte=4
+    ).exists():
+        sync_profile_vector(instance.user_id, instance.paper_id, False)
 
 
 @receiver(post_save, sender=ReadingProgress)
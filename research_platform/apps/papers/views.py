@@ -268,22 +268,18 @@ def reject_paper(request, pk):
 @login_required
 def get_recommendations(request):
     try:
-        from apps.ml_engine.models import UserRecommendation
-        from apps.ml_engine.tasks import generate_recommendations
-        from .background import executor
+        from apps.ml_engine import recommendation_cache
+        from apps.ml_engine.refresh_queue import refresh_queue
 
-        recs_qs = UserRecommendation.objects.filter(
-            user=request.user
-        ).select_related('paper__uploaded_by').prefetch_related('paper__categories')
+        recommendations = recommendation_cache.get_recommendations(request.user.id)
 
         # First-visit: kick off background generation and show empty state
         generating = False
-        if not recs_qs.exists():
-            executor.submit(generate_recommendations, request.user.id)
+        if not recommendations:
+            refresh_queue.schedule(request.user.id, delay=0)
             generating = True
 
-        recommendations = list(recs_qs.order_by('-score')[:10])
-        last_updated = recommendations[0].created_at if recommendations else None
+        last_updated = recommendations[0]['created_at'] if recommendations else None
 
     except ImportError:
         recommendations = []
@@ -292,8 +288,8 @@ def get_recommendations(request):
 
     if request.META.get('HTTP_ACCEPT') == 'application/json':
         data = [
-            {'paper_id': r.paper.id, 'title': r.paper.title,
-             'score': r.score, 'reason': r.reason}
+            {'paper_id': r['paper']['pk'], 'title': r['paper']['title'],
+             'score': r['score'], 'reason': r['reason']}
             for r in recommendations
         ]
         return JsonResponse({'recommendations': data})
@@ -309,9 +305,8 @@ def get_recommendations(request):
 def refresh_recommendations(request):
     """Trigger an on-demand recommendation refresh, then redirect back."""
     try:
-        from apps.ml_engine.tasks import generate_recommendations
-        from .background import executor
-        executor.submit(generate_recommendations, request.user.id)
+        from apps.ml_engine.refresh_queue import refresh_queue
+        refresh_queue.schedule(request.user.id, delay=0)
         messages.success(request, 'Refreshing your recommendations in the background. Check back in a moment.')
     except Exception:
         messages.error(request, 'Could not refresh recommendations. Please try again later.')
@@ -866,7 +861,9 @@ def get_related_papers(request, pk):
     """Get related papers for a given paper"""
     paper = get_object_or_404(Paper, pk=pk)
     
-    related = RelatedPaper.objects.filter(paper=paper).select_related('related_to')[:10]
+    related = RelatedPaper.objects.filter(paper=paper).select_related('related_to').order_by(
+        '-similarity_score'
+    )[:10]
     
     data = []
     for rel in related:
@@ -113,6 +113,21 @@ else:
         },
     }
 
+# Use Redis for the cache in production; fall back to local memory for local dev
+if os.environ.get('USE_REDIS_CACHE', 'False') == 'True':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
@@ -147,6 +162,66 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 ML_MODELS_PATH = BASE_DIR / 'ml_models'
 TRANSFORMERS_CACHE = BASE_DIR / 'transformers_cache'
 
+# Recommendation / RAG engine
+ML_EMBEDDING_MODEL = os.environ.get('ML_EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+# Whether that model lowercases its input ('True'/'False'); unset = read do_lower_case from its config
+ML_EMBEDDING_LOWERCASE = {'True': True, 'False': False}.get(os.environ.get('ML_EMBEDDING_LOWERCASE', ''))
+# Load the embedding model in the background at start-up instead of on first use
+ML_WARMUP_MODELS = os.environ.get('ML_WARMUP_MODELS', 'False') == 'True'
+# Encoder processes per Django process (1 = encode in-process); threads per worker (0 = cores / workers)
+ML_ENCODER_WORKERS = int(os.environ.get('ML_ENCODER_WORKERS', '1'))
+ML_ENCODER_THREADS = int(os.environ.get('ML_ENCODER_THREADS', '0'))
+ML_ENCODER_PIN_CPUS = os.environ.get('ML_ENCODER_PIN_CPUS', 'False') == 'True'
+# Papers read, encoded and written per batch by build_embeddings
+ML_ENCODE_BATCH_SIZE = int(os.environ.get('ML_ENCODE_BATCH_SIZE', '256'))
+# Papers per bulk vector-store write and PDF extraction processes (0 = one per core)
+ML_VECTOR_INDEX_BATCH_SIZE = int(os.environ.get('ML_VECTOR_INDEX_BATCH_SIZE', '64'))
+ML_VECTOR_INDEX_WORKERS = int(os.environ.get('ML_VECTOR_INDEX_WORKERS', '0'))
+# RAG search: query embeddings kept per process, and seconds a search result stays cached
+ML_RAG_QUERY_CACHE_SIZE = int(os.environ.get('ML_RAG_QUERY_CACHE_SIZE', '1024'))
+ML_RAG_RESULT_CACHE_TTL = int(os.environ.get('ML_RAG_RESULT_CACHE_TTL', '60'))
+# RAG retrieval: 'dense', 'lexical' (BM25) or 'hybrid' (reciprocal rank fusion of both),
+# chunks taken from each ranking before fusion and the RRF constant
+ML_RAG_SEARCH_MODE = os.environ.get('ML_RAG_SEARCH_MODE', 'hybrid')
+ML_RAG_FUSION_CANDIDATES = int(os.environ.get('ML_RAG_FUSION_CANDIDATES', '20'))
+ML_RAG_RRF_K = int(os.environ.get('ML_RAG_RRF_K', '60'))
+ML_LEXICAL_INDEX_DIR = BASE_DIR / 'lexical_index'
+# Chunks passed to the LLM and their estimated token budget
+ML_RAG_CONTEXT_CHUNKS = int(os.environ.get('ML_RAG_CONTEXT_CHUNKS', '5'))
+ML_RAG_CONTEXT_TOKEN_BUDGET = int(os.environ.get('ML_RAG_CONTEXT_TOKEN_BUDGET', '2000'))
+# Cross-encoder re-ranking: candidates over-fetched, pairs per batch and the per-query
+# deadline (0 = none) after which chunks keep their retrieval order
+ML_RAG_RERANK = os.environ.get('ML_RAG_RERANK', 'False') == 'True'
+ML_RAG_RERANK_MODEL = os.environ.get('ML_RAG_RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+ML_RAG_RERANK_CANDIDATES = int(os.environ.get('ML_RAG_RERANK_CANDIDATES', '20'))
+ML_RAG_RERANK_BATCH_SIZE = int(os.environ.get('ML_RAG_RERANK_BATCH_SIZE', '16'))
+ML_RAG_RERANK_DEADLINE_MS = int(os.environ.get('ML_RAG_RERANK_DEADLINE_MS', '300'))
+# In-memory embedding matrix precision: 'float32', 'float16' or 'int8' (per-vector scales)
+ML_EMBEDDING_PRECISION = os.environ.get('ML_EMBEDDING_PRECISION', 'float32')
+# Candidates re-scored against exact float32 vectors when the precision is reduced (0 = off)
+ML_EMBEDDING_RERANK = int(os.environ.get('ML_EMBEDDING_RERANK', '50'))
+# Seconds between checks of the shared embeddings version counter (how soon other processes reload)
+ML_EMBEDDINGS_VERSION_CHECK_SECONDS = float(os.environ.get('ML_EMBEDDINGS_VERSION_CHECK_SECONDS', '5'))
+# Approximate nearest-neighbour backend for recommendations: 'hnsw', 'ivf' or '' for exact search
+ML_ANN_BACKEND = os.environ.get('ML_ANN_BACKEND', '')
+ML_ANN_INDEX_DIR = BASE_DIR / 'ann_index'
+# Collaborative filtering: 'matrix' (sparse item-item) or 'counts' (per-user co-rater queries)
+ML_CF_MODE = os.environ.get('ML_CF_MODE', 'matrix')
+ML_CF_REFRESH_SECONDS = int(os.environ.get('ML_CF_REFRESH_SECONDS', '900'))
+ML_CF_NEIGHBOURS = 50
+# Neighbours stored per paper in RelatedPaper by apps.ml_engine.related
+ML_RELATED_PAPERS = int(os.environ.get('ML_RELATED_PAPERS', '10'))
+# Cold-start popularity priors: papers kept per list, trending window and refresh interval
+ML_PRIORS_TOP_N = int(os.environ.get('ML_PRIORS_TOP_N', '200'))
+ML_PRIORS_TRENDING_DAYS = int(os.environ.get('ML_PRIORS_TRENDING_DAYS', '30'))
+ML_PRIORS_REFRESH_SECONDS = int(os.environ.get('ML_PRIORS_REFRESH_SECONDS', '3600'))
+# Default hybrid blend: (content, collaborative, popularity)
+ML_HYBRID_WEIGHTS = (0.6, 0.3, 0.1)
+# Rating/bookmark bursts within this many seconds are folded into one recommendation refresh
+ML_REFRESH_DEBOUNCE_SECONDS = float(os.environ.get('ML_REFRESH_DEBOUNCE_SECONDS', '10'))
+# Seconds a user's serialised recommendations stay cached (dropped early when a refresh commits)
+ML_RECOMMENDATION_CACHE_TTL = int(os.environ.get('ML_RECOMMENDATION_CACHE_TTL', '300'))
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",